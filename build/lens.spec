@@ -32,7 +32,7 @@ mkdir -p %{buildroot}%{_datadir}/%{name}
 cp -a lens-data/*  %{buildroot}%{_datadir}/%{name}/
 install -m 0644 COPYING %{buildroot}%{_datadir}/%{name}/
 
-for f in __init__.py app.py appgtk.py appqt4.py appqt5.py system.py thread.py view.py
+for f in __init__.py app.py appgtk.py appqt4.py appqt5.py blob.py bundle.py metrics.py resource.py rpc.py serializer.py system.py thread.py tracer.py view.py watchdog.py
 do
   install -m 0644 lens/${f} %{buildroot}%{python3_sitelib}/lens/${f}
 done
@@ -51,14 +51,30 @@ Python 3 API for constructing LENS applications
 %files -n  python3-%{name}
 %{python3_sitelib}/lens/__init__.py
 %{python3_sitelib}/lens/app.py
+%{python3_sitelib}/lens/blob.py
+%{python3_sitelib}/lens/bundle.py
+%{python3_sitelib}/lens/metrics.py
+%{python3_sitelib}/lens/resource.py
+%{python3_sitelib}/lens/rpc.py
+%{python3_sitelib}/lens/serializer.py
 %{python3_sitelib}/lens/system.py
 %{python3_sitelib}/lens/thread.py
+%{python3_sitelib}/lens/tracer.py
 %{python3_sitelib}/lens/view.py
+%{python3_sitelib}/lens/watchdog.py
 %{python3_sitelib}/lens/__pycache__/__init__.*.py*
 %{python3_sitelib}/lens/__pycache__/app.*.py*
+%{python3_sitelib}/lens/__pycache__/blob.*.py*
+%{python3_sitelib}/lens/__pycache__/bundle.*.py*
+%{python3_sitelib}/lens/__pycache__/metrics.*.py*
+%{python3_sitelib}/lens/__pycache__/resource.*.py*
+%{python3_sitelib}/lens/__pycache__/rpc.*.py*
+%{python3_sitelib}/lens/__pycache__/serializer.*.py*
 %{python3_sitelib}/lens/__pycache__/system.*.py*
 %{python3_sitelib}/lens/__pycache__/thread.*.py*
+%{python3_sitelib}/lens/__pycache__/tracer.*.py*
 %{python3_sitelib}/lens/__pycache__/view.*.py*
+%{python3_sitelib}/lens/__pycache__/watchdog.*.py*
 
 
 %package -n python3-%{name}-gtk
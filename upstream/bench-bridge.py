@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+
+from lens.app import LensApp
+
+app = LensApp(name='Lens. Bridge Benchmark')
+
+# load the app entry page
+app.namespaces.append('./sample-data/bench-bridge')
+
+run = {}
+
+@app.bind('bench-start')
+def _bench_start_cb(transport, count):
+  run.update(transport=transport, count=count, received=0, start=time.perf_counter(), last=None)
+
+@app.bind('bench-message')
+def _bench_message_cb(i, payload):
+  run['received'] += 1
+  run['last'] = time.perf_counter()
+
+@app.bind('bench-done')
+def _bench_done_cb(transport):
+  elapsed = (run['last'] or run['start']) - run['start']
+  rate = run['received'] / elapsed if elapsed > 0 else 0
+
+  print('%-10s %8d/%-8d received %12.0f msg/s' % (transport, run['received'], run['count'], rate))
+
+@app.bind('bench-finished')
+def _bench_finished_cb():
+  app.close()
+
+app.start()
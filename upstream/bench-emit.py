@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import logging
+import timeit
+
+from lens.view import EventEmitter
+
+logger = logging.getLogger('Lens.EventEmitter')
+
+class LegacyEventEmitter():
+  """
+  The list building EventEmitter.emit() dispatch used before precompiled
+  subscriber tuples, kept here as a baseline.
+  """
+  def __init__(self):
+    self.events = {}
+    self.events_once = {}
+
+  def emit(self, name, *args, **kwargs):
+    s = self.events.get(name, [])
+    so = self.events_once.pop(name, [])
+    gs = self.events.get('__*', [])
+
+    logger.debug('Emit %s in %s (%d, %d)' % (name, self, len(s)+len(so), len(gs)))
+
+    for cb in s + so:
+      cb(*args, **kwargs)
+
+    for cb in gs:
+      cb(name, *args, **kwargs)
+
+  def on(self, name, callback):
+    self.events.setdefault(name, []).append(callback)
+
+  def on_any(self, callback):
+    self.events.setdefault('__*', []).append(callback)
+
+
+def _cb(*args):
+  pass
+
+def bench(klass, subscribers, count):
+  e = klass()
+
+  for i in range(subscribers):
+    e.on('progress', _cb)
+
+  e.on_any(_cb)
+
+  t = timeit.timeit(lambda: e.emit('progress', 'uuid', 42), number=count)
+
+  return t / count * 1e9
+
+
+if __name__ == '__main__':
+  count = 200000
+
+  print('%-12s %12s %12s' % ('subscribers', 'legacy (ns)', 'lens (ns)'))
+
+  for subscribers in [0, 1, 4, 16]:
+    legacy = bench(LegacyEventEmitter, subscribers, count)
+    lens = bench(EventEmitter, subscribers, count)
+
+    print('%-12d %12.1f %12.1f' % (subscribers, legacy, lens))
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import subprocess
+import sys
+import time
+
+from lens.system import ProcessTable
+from lens.thread import Thread
+
+def sample_scan():
+  # the ProcTask.run() body of sample-app-top.py before ProcessTable
+  pids = [pid for pid in os.listdir('/proc') if pid.isdigit()]
+
+  loadavg = open('/proc/loadavg', 'r').read().strip().split(' ')
+  meminfo = [x.split()[1] for x in open('/proc/meminfo', 'r').read().strip().split('\n')]
+
+  proc = {}
+
+  for pid in pids:
+    try:
+      stats = open(os.path.join('/proc', pid, 'stat'), 'r').read().strip().split(' ')
+      statm = open(os.path.join('/proc', pid, 'statm'), 'r').read().strip().split(' ')
+      cmdline = open(os.path.join('/proc', pid, 'cmdline'), 'r').read()
+
+      proc[pid] = {
+        'cmdline': cmdline,
+        'pid': int(stats[0]),
+        'comm': stats[1],
+        'state': stats[2],
+        'ppid': int(stats[3]),
+        'priority': int(stats[17]),
+        'nice': int(stats[18]),
+        'vsize': int(stats[22]),
+        'mem_size': int(statm[0]),
+        'mem_resident': int(statm[1]),
+        'mem_shared': int(statm[2]),
+        'mem_percentage': round(int(statm[1]) * 100.0 / int(meminfo[0]), 2)
+      }
+
+    except:
+      continue
+
+  return proc
+
+def bench_sample(scans):
+  t = Thread()
+  sent = []
+  t.on('proc-update', lambda delta: sent.append(len(delta['set']) + len(delta['del'])))
+
+  t0 = time.perf_counter()
+  for i in range(scans):
+    t.emit_state('proc-update', sample_scan())
+
+  return (time.perf_counter() - t0) / scans * 1e3, sum(sent[1:]) / max(scans - 1, 1)
+
+def bench_table(scans):
+  table = ProcessTable()
+  sent = []
+
+  t0 = time.perf_counter()
+  for i in range(scans):
+    delta = table.scan()
+    sent.append(len(delta['set']) + len(delta['del']))
+
+  elapsed = time.perf_counter() - t0
+  table.close()
+
+  return elapsed / scans * 1e3, sum(sent[1:]) / max(scans - 1, 1)
+
+
+if __name__ == '__main__':
+  # idle processes to add to the table
+  spawn = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+  scans = 10
+
+  children = [subprocess.Popen(['sleep', '3600']) for i in range(spawn)]
+
+  try:
+    count = len([pid for pid in os.listdir('/proc') if pid.isdigit()])
+
+    print('%d processes, %d scans' % (count, scans))
+    print('%-14s %12s %16s' % ('engine', 'scan (ms)', 'rows sent/scan'))
+
+    for name, bench in [('sample', bench_sample), ('ProcessTable', bench_table)]:
+      ms, rows = bench(scans)
+      print('%-14s %12.2f %16.1f' % (name, ms, rows))
+
+  finally:
+    for c in children:
+      c.kill()
+      c.wait()
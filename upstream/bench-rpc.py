@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+from lens.app import LensApp
+
+app = LensApp(name='Lens. RPC Benchmark')
+
+# load the app entry page
+app.namespaces.append('./sample-data/bench-rpc')
+
+# the two signal round trip RPC replaces
+@app.bind('bench-ping')
+def _bench_ping_cb(value):
+  app.emit('bench-pong', value)
+
+@app.rpc('bench-sync')
+def _bench_sync(value):
+  return value
+
+@app.rpc('bench-async')
+async def _bench_async(value):
+  return value
+
+@app.rpc('bench-thread', executor='thread')
+def _bench_thread(value):
+  return value
+
+@app.bind('bench-report')
+def _bench_report_cb(name, count, elapsed, p50, p99):
+  print('%-8s %6d calls %10.0f calls/s   p50 %7.3f ms   p99 %7.3f ms' % (name, count, count / elapsed * 1000, p50, p99))
+
+@app.bind('bench-finished')
+def _bench_finished_cb():
+  app.close()
+
+app.start()
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import timeit
+
+from lens.serializer import SERIALIZERS
+
+def proc_payload(count=500):
+  """
+  A process table shaped like the one ProcTask in sample-app-top.py emits.
+  """
+  return [{
+    'cmdline': '/usr/lib/some/daemon --option=%d --another-option' % (pid),
+    'pid': pid,
+    'comm': '(daemon-%d)' % (pid),
+    'state': 'S',
+    'ppid': 1,
+    'priority': 20,
+    'nice': 0,
+    'vsize': 123456789 + pid,
+    'mem_size': 12345 + pid,
+    'mem_resident': 2345 + pid,
+    'mem_shared': 345 + pid,
+    'mem_percentage': round(pid / 1000.0, 2)
+  } for pid in range(count)]
+
+
+if __name__ == '__main__':
+  message = ['update-proc', proc_payload()]
+  count = 200
+
+  print('%-10s %12s %12s %10s' % ('serializer', 'dumps (us)', 'loads (us)', 'bytes'))
+
+  # the previous bridge encoding, as a baseline
+  data = json.dumps(message)
+  dumps = timeit.timeit(lambda: json.dumps(message), number=count) / count * 1e6
+  loads = timeit.timeit(lambda: json.loads(data), number=count) / count * 1e6
+  print('%-10s %12.1f %12.1f %10d' % ('baseline', dumps, loads, len(data)))
+
+  for name, klass in SERIALIZERS.items():
+    if klass is None:
+      print('%-10s %12s' % (name, 'unavailable'))
+      continue
+
+    s = klass()
+    data = s.dumps(message)
+
+    dumps = timeit.timeit(lambda: s.dumps(message), number=count) / count * 1e6
+    loads = timeit.timeit(lambda: s.loads(data), number=count) / count * 1e6
+
+    print('%-10s %12.1f %12.1f %10d' % (name, dumps, loads, len(data)))
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+
+from lens.view import EventEmitter
+
+SIGNALS = ['started', 'progress', 'complete', 'state', 'error']
+
+class LegacyEventEmitter():
+  """
+  The EventEmitter subscription and routing before namespaces, as the
+  baseline.
+  """
+  def __init__(self):
+    self.__events = {}
+    self.__events_once = {}
+
+  def emit(self, name, *args, **kwargs):
+    s = self.__events.get(name, [])
+    so = self.__events_once.pop(name, [])
+    gs = self.__events.get('__*', [])
+
+    for cb in s + so:
+      cb(*args, **kwargs)
+
+    for cb in gs:
+      cb(name, *args, **kwargs)
+
+  def on(self, name, callback):
+    self.__events.setdefault(name, []).append(callback)
+
+    return callback
+
+  def unsubscribe_like(self, like):
+    self.__events = {k:self.__events[k] for k in self.__events if like not in k}
+
+def _cb(*args):
+  pass
+
+def subscribe(e, threads, namespaced):
+  for uuid in threads:
+    for name in SIGNALS:
+      if namespaced:
+        e.on('__thread_%s_%s' % (uuid, name), _cb, namespace=uuid)
+      else:
+        e.on('__thread_%s_%s' % (uuid, name), _cb)
+
+def bench(count, mode):
+  threads = ['LensThread-%d-%f' % (i, time.time()) for i in range(count)]
+  namespaced = mode == 'namespace'
+
+  e = LegacyEventEmitter() if mode == 'legacy like' else EventEmitter()
+  subscribe(e, threads, namespaced)
+
+  # route one signal per live thread
+  t0 = time.perf_counter()
+  for uuid in threads:
+    e.emit('__thread_%s_progress' % (uuid), uuid, 50)
+  emit = time.perf_counter() - t0
+
+  # complete every thread, dropping its subscriptions
+  t0 = time.perf_counter()
+  for uuid in threads:
+    if namespaced:
+      e.unsubscribe_namespace(uuid)
+    else:
+      e.unsubscribe_like('__thread_%s_' % (uuid))
+  drop = time.perf_counter() - t0
+
+  return emit / count * 1e6, drop / count * 1e6
+
+
+if __name__ == '__main__':
+  print('%-8s %-22s %14s %14s' % ('threads', 'unsubscribe', 'emit (us)', 'drop (us)'))
+
+  for count in [100, 1000]:
+    for mode in ['legacy like', 'like', 'namespace']:
+      emit, drop = bench(count, mode)
+      print('%-8d %-22s %14.2f %14.2f' % (count, mode, emit, drop))
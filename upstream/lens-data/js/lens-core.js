@@ -24,24 +24,129 @@ window.lens = {
 			});
 		}
 	},
-	"emit": function () {
+	"__emit_batch": function (batch) {
+		for (var i = 0; i < batch.length; i++) {
+			window.lens.__emit(batch[i]);
+		}
+	},
+	"__transport": null,
+	"__transports": {
+		/* WebKit2 script message handler */
+		"message": function (data) {
+			window.webkit.messageHandlers.lens.postMessage(data);
+		},
+		/* QtWebChannel bridge object */
+		"channel": function (data) {
+			window.__lens_channel.post(data);
+		},
+		/* fallback, update document title */
+		"title": function (data) {
+			var t = document.title;
+			document.title = '_BR::' + data;
+			document.title = t;
+		}
+	},
+	"__detect_transport": function () {
+		if (window.webkit && window.webkit.messageHandlers && window.webkit.messageHandlers.lens) {
+			return 'message';
+		}
+
+		/* the web channel becomes available asynchronously */
+		if (window.__lens_channel) {
+			return 'channel';
+		}
+
+		return 'title';
+	},
+	"__rpc_id": 0,
+	"__rpc_calls": {},
+	"__rpc_reply": function (reply) {
+		var id = reply[0];
+		var error = reply[1];
+		var call = window.lens.__rpc_calls[id];
+
+		/* ignore replies to cancelled or timed out calls */
+		if (!call) {
+			return;
+		}
+
+		delete window.lens.__rpc_calls[id];
+		clearTimeout(call.timer);
+
+		if (error !== null) {
+			call.reject(new Error(error));
+		} else {
+			call.resolve(reply[2]);
+		}
+	},
+	/* default call timeout in ms, 0 waits forever */
+	"rpc_timeout": 30000,
+	"call": function () {
 		var _args = Array.prototype.slice.call(arguments);
 
-		if (_args.length > 0) {
-			var msg = {name: _args.shift(), args: _args};
+		return window.lens.call_timeout.apply(undefined, [window.lens.rpc_timeout].concat(_args));
+	},
+	"call_timeout": function (timeout, name) {
+		var args = Array.prototype.slice.call(arguments, 2);
+		var id = ++window.lens.__rpc_id;
+		var call = {};
 
-			try {
-				/* If we are using QtWebChannel */
-				msg['name'](_args);
-			}
-			finally {
-				/* update document title */
-				var t = document.title;
-				document.title = '_BR::' + JSON.stringify(msg);
-				document.title = t;
+		var promise = new Promise(function (resolve, reject) {
+			call.resolve = resolve;
+			call.reject = reject;
+		});
+
+		var cancel = function (reason) {
+			if (window.lens.__rpc_calls[id]) {
+				delete window.lens.__rpc_calls[id];
+				clearTimeout(call.timer);
+
+				window.lens.emit('__rpc_cancel', id);
+				call.reject(new Error('RPC "' + name + '" ' + reason));
 			}
+		};
 
+		if (timeout > 0) {
+			call.timer = setTimeout(function () {
+				cancel('timed out');
+			}, timeout);
 		}
+
+		window.lens.__rpc_calls[id] = call;
+		window.lens.emit('__rpc_call', id, name, args);
+
+		promise.cancel = function () {
+			cancel('cancelled');
+		};
+
+		return promise;
+	},
+	"emit": function () {
+		var _args = Array.prototype.slice.call(arguments);
+
+		if (_args.length > 0) {
+			var data = JSON.stringify({name: _args.shift(), args: _args});
+			var transport = window.lens.__transport || window.lens.__detect_transport();
+
+			window.lens.__transports[transport](data);
+		}
+	},
+	"fetch_blob": function (uri, type) {
+		/* load a blob from app.blob() as an ArrayBuffer, or a typed array
+		 * when a type such as 'Float64Array' is given */
+		return new Promise(function (resolve, reject) {
+			var xhr = new XMLHttpRequest();
+
+			xhr.open('GET', uri);
+			xhr.responseType = 'arraybuffer';
+			xhr.onload = function () {
+				resolve(type ? new window[type](xhr.response) : xhr.response);
+			};
+			xhr.onerror = function () {
+				reject(new Error('Unable to load blob: ' + uri));
+			};
+			xhr.send();
+		});
 	},
 	"has_subscribers": function (name) {
 		s = window.lens.__cb[name] || [];
@@ -53,6 +158,33 @@ window.lens = {
 		window.lens.__cb[name] = window.lens.__cb[name] || [];
 		window.lens.__cb[name].push(cb);
 	},
+	"__states": {},
+	"patch_state": function (state, delta) {
+		/* rebuild the full state from a Thread.emit_state() delta */
+		if (delta.reset || !state) {
+			state = {};
+		}
+
+		for (var k in delta.set) {
+			if (delta.set.hasOwnProperty(k)) {
+				state[k] = delta.set[k];
+			}
+		}
+
+		delta.del.forEach(function (k) {
+			delete state[k];
+		});
+
+		return state;
+	},
+	"on_state": function (name, cb) {
+		window.lens.on(name, function (delta) {
+			var state = window.lens.patch_state(window.lens.__states[name], delta);
+
+			window.lens.__states[name] = state;
+			cb(state, delta);
+		});
+	},
 	"on_any": function (cb) {
 		window.lens.__cb['__*'] = window.lens.__cb['__*'] || [];
 		window.lens.__cb['__*'].push(cb);
@@ -1 +1 @@
-window.lens={__cb:{},__cb_once:{},__emit:function(n){if(n.length>0){var _=n[0],o=n.slice(1);s=window.lens.__cb[_]||[],gs=window.lens.__cb["__*"]||[],so=window.lens.__cb_once[_]||[],delete window.lens.__cb_once[_],s.forEach(function(n){n.apply(void 0,o)}),so.forEach(function(n){n.apply(void 0,o)}),gs.forEach(function(_){_.apply(void 0,n)})}},emit:function(){var n=Array.prototype.slice.call(arguments);if(n.length>0){var _={name:n.shift(),args:n},o=document.title;document.title="_BR::"+JSON.stringify(_),document.title=o}},has_subscribers:function(n){return s=window.lens.__cb[n]||[],so=window.lens.__cb_once[n]||[],s.length+so.length},on:function(n,_){window.lens.__cb[n]=window.lens.__cb[n]||[],window.lens.__cb[n].push(_)},on_any:function(n){window.lens.__cb["__*"]=window.lens.__cb["__*"]||[],window.lens.__cb["__*"].push(n)},once:function(n,_){window.lens.__cb_once[n]=window.lens.__cb[n]||[],window.lens.__cb_once[n].push(_)}};
\ No newline at end of file
+window.lens={__cb:{},__cb_once:{},__emit:function(n){if(n.length>0){var _=n[0],o=n.slice(1);s=window.lens.__cb[_]||[],gs=window.lens.__cb["__*"]||[],so=window.lens.__cb_once[_]||[],delete window.lens.__cb_once[_],s.forEach(function(n){n.apply(void 0,o)}),so.forEach(function(n){n.apply(void 0,o)}),gs.forEach(function(_){_.apply(void 0,n)})}},__emit_batch:function(n){for(var _=0;_<n.length;_++)window.lens.__emit(n[_])},__transport:null,__transports:{message:function(n){window.webkit.messageHandlers.lens.postMessage(n)},channel:function(n){window.__lens_channel.post(n)},title:function(n){var _=document.title;document.title="_BR::"+n,document.title=_}},__detect_transport:function(){return window.webkit&&window.webkit.messageHandlers&&window.webkit.messageHandlers.lens?"message":window.__lens_channel?"channel":"title"},__rpc_id:0,__rpc_calls:{},__rpc_reply:function(n){var _=n[0],o=n[1],e=window.lens.__rpc_calls[_];e&&(delete window.lens.__rpc_calls[_],clearTimeout(e.timer),null!==o?e.reject(new Error(o)):e.resolve(n[2]))},rpc_timeout:3e4,call:function(){var n=Array.prototype.slice.call(arguments);return window.lens.call_timeout.apply(void 0,[window.lens.rpc_timeout].concat(n))},call_timeout:function(n,_){var o=Array.prototype.slice.call(arguments,2),e=++window.lens.__rpc_id,r={},c=new Promise(function(n,_){r.resolve=n,r.reject=_}),l=function(n){window.lens.__rpc_calls[e]&&(delete window.lens.__rpc_calls[e],clearTimeout(r.timer),window.lens.emit("__rpc_cancel",e),r.reject(new Error('RPC "'+_+'" '+n)))};return n>0&&(r.timer=setTimeout(function(){l("timed out")},n)),window.lens.__rpc_calls[e]=r,window.lens.emit("__rpc_call",e,_,o),c.cancel=function(){l("cancelled")},c},emit:function(){var n=Array.prototype.slice.call(arguments);if(n.length>0){var _=JSON.stringify({name:n.shift(),args:n}),o=window.lens.__transport||window.lens.__detect_transport();window.lens.__transports[o](_)}},fetch_blob:function(n,_){return new Promise(function(o,e){var r=new XMLHttpRequest;r.open("GET",n),r.responseType="arraybuffer",r.onload=function(){o(_?new window[_](r.response):r.response)},r.onerror=function(){e(new Error("Unable to load blob: "+n))},r.send()})},has_subscribers:function(n){return s=window.lens.__cb[n]||[],so=window.lens.__cb_once[n]||[],s.length+so.length},on:function(n,_){window.lens.__cb[n]=window.lens.__cb[n]||[],window.lens.__cb[n].push(_)},__states:{},patch_state:function(n,_){(_.reset||!n)&&(n={});for(var o in _.set)_.set.hasOwnProperty(o)&&(n[o]=_.set[o]);return _.del.forEach(function(_){delete n[_]}),n},on_state:function(n,_){window.lens.on(n,function(o){var e=window.lens.patch_state(window.lens.__states[n],o);window.lens.__states[n]=e,_(e,o)})},on_any:function(n){window.lens.__cb["__*"]=window.lens.__cb["__*"]||[],window.lens.__cb["__*"].push(n)},once:function(n,_){window.lens.__cb_once[n]=window.lens.__cb[n]||[],window.lens.__cb_once[n].push(_)}};
\ No newline at end of file
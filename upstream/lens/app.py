@@ -15,16 +15,83 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
+import functools
+import importlib.util
 import logging
 import os
 import subprocess
+import time
 import traceback
 
+from lens.rpc import RPC
+from lens.system import SystemInfo
+from lens.tracer import tracer
+from lens.watchdog import Watchdog
 from utils import dbus_proxy
 
 logger = logging.getLogger('Lens.App')
 
 
+@functools.lru_cache(maxsize=1)
+def _running_processes():
+    """Returns the names of all running processes, read once per process."""
+    try:
+        names = set()
+
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+
+            try:
+                with open('/proc/%s/comm' % pid, 'r') as f:
+                    names.add(f.read().strip())
+
+            except (OSError, IOError):
+                # process has already terminated
+                continue
+
+        return names
+
+    except OSError:
+        pass
+
+    try:
+        # no procfs, fall back to a single ps scan
+        return subprocess.check_output(["ps", "axw"], universal_newlines=True)
+
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+@functools.lru_cache(maxsize=None)
+def _probe_desktop(hint):
+    """Determines the running desktop, probing the environment only once."""
+    xdg = (os.environ.get('XDG_CURRENT_DESKTOP', '') + ':' +
+           os.environ.get('DESKTOP_SESSION', '')).lower()
+
+    if os.environ.get('KDE_FULL_SESSION') == 'true' or 'kde' in xdg:
+        return 'kde'
+
+    elif os.environ.get('GNOME_DESKTOP_SESSION_ID') or 'gnome' in xdg:
+        return 'gnome'
+
+    elif 'xfce' in xdg:
+        return 'xfce'
+
+    elif 'mate' in xdg:
+        return 'mate'
+
+    running = _running_processes()
+
+    if 'xfce-mcs-manage' in running or 'xfce4-session' in running:
+        return 'xfce'
+
+    elif 'ksmserver' in running:
+        return 'kde'
+
+    return hint
+
+
 class LensApp:
     """
     The app object implements a Lens application and acts as the central
@@ -39,20 +106,50 @@ class LensApp:
                  application window's title bar.
     :param width: the width of the Lens applciation window. Defaults to 640.
     :param height the height of the Lens applciation window. Defaults to 480.
+    :param thread_pool: run threads on a pool of persistent worker processes
+                        instead of one process per thread. Either `True` or
+                        the number of workers. Defaults to `False`.
+    :param metrics: collect metrics of messages crossing the python/JS bridge,
+                    see `metrics`. Also enabled with `LENS_METRICS=1`.
+    :param metrics_dump: log the bridge metrics every given number of
+                         seconds. Also set with `LENS_METRICS_DUMP`.
+    :param watchdog: log signal handlers running longer than the given number
+                     of seconds on the main loop. Also enabled, with a 50ms
+                     budget, with `LENS_WATCHDOG=1`.
+    :param watchdog_offload: run handlers that exceeded the watchdog budget
+                             on a worker thread from then on. Defaults to
+                             `False`.
+    :param batch_emits: collect signals emitted to the UI within one main loop
+                        iteration and deliver them in a single JS call.
+                        Defaults to `False`.
 
     """
     def __init__(self, toolkit=None, toolkit_hint='gtk', name="MyLensApp", *args, **kwargs):
+        _start = time.perf_counter()
+
         self._app_name = name
         self._app_width = kwargs.get('width', 640)
         self._app_height = kwargs.get('height', 480)
 
         self._start_maximized = kwargs.get('start_maximized', False)
+        self._batch_emits = kwargs.get('batch_emits', False)
+        self._thread_pool = kwargs.get('thread_pool', False)
 
         #: check environment for inspector overrides
         self._inspector = False
         if os.environ.get('LENS_INSPECTOR') == '1':
             self._inspector = kwargs.get('inspector', True)
 
+        #: check environment for bridge metrics overrides
+        self._metrics = kwargs.get('metrics', False) or os.environ.get('LENS_METRICS') == '1'
+        self._metrics_dump = float(os.environ.get('LENS_METRICS_DUMP', 0)) or kwargs.get('metrics_dump')
+
+        #: check environment for watchdog overrides
+        self._watchdog = None
+        _budget = kwargs.get('watchdog') or (0.05 if os.environ.get('LENS_WATCHDOG') == '1' else None)
+        if _budget:
+            self._watchdog = Watchdog(_budget, offload=kwargs.get('watchdog_offload', False))
+
         #: check environment for debug overrides
         if os.environ.get('LENS_DEBUG') == '1':
             logging.basicConfig(level=logging.DEBUG)
@@ -84,20 +181,27 @@ class LensApp:
         #: manage directory namespaces for local app data
         self.namespaces = []
 
+        tracer.complete('LensApp', _start, time.perf_counter())
+
     @staticmethod
     def __get_toolkit(name, exact=False):
         #: defines the list of Lens backends to be preloaded for auto-detection
-        toolkits = {'gtk3': ['lens.appgtk', 'ViewGtk'],
-                    'gtk': ['lens.appgtk', 'ViewGtk'],
-                    'qt4': ['lens.appqt4', 'ViewQt4'],
-                    'qt5': ['lens.appqt5', 'ViewQt5'],
-                    'qt': ['lens.appqt5', 'ViewQt5']}
+        #: along with the module each requires
+        toolkits = {'gtk3': ['lens.appgtk', 'ViewGtk', 'gi'],
+                    'gtk': ['lens.appgtk', 'ViewGtk', 'gi'],
+                    'qt4': ['lens.appqt4', 'ViewQt4', 'PyQt4'],
+                    'qt5': ['lens.appqt5', 'ViewQt5', 'PyQt5'],
+                    'qt': ['lens.appqt5', 'ViewQt5', 'PyQt5']}
 
         tk_error = []
 
         if name and name in toolkits:
             try:
                 tk = toolkits[name]
+
+                if importlib.util.find_spec(tk[2]) is None:
+                    raise ImportError('Module %s not found.' % tk[2])
+
                 tk_module = __import__(tk[0], globals(), locals(), [tk[1]], 0)
                 logger.debug('Loaded: {0}'.format(name))
 
@@ -109,57 +213,31 @@ class LensApp:
                         'Toolkit %s is not implemented or could not be loaded.' % name)
                 else:
                     logger.debug(traceback.format_exc())
-                    tk_error.append(name)
+                    tk_error.append(tk[0])
 
         for tkit in toolkits:
-            if tkit in tk_error:
+            tk = toolkits[tkit]
+
+            # skip backends already tried or missing their toolkit without
+            # importing anything
+            if tk[0] in tk_error or importlib.util.find_spec(tk[2]) is None:
                 continue
+
             try:
                 logger.debug('Loading fallback: {0}'.format(tkit))
-                tk = toolkits[tkit]
                 tk_module = __import__(tk[0], globals(), locals(), [tk[1]], 0)
 
                 return getattr(tk_module, tk[1], None)
 
             except (ImportError, KeyError):
                 logger.debug(traceback.format_exc())
-                tk_error.append(tkit)
+                tk_error.append(tk[0])
                 continue
 
         raise Exception('No fallback toolkits loaded.')
 
-    @staticmethod
-    def __is_running(process):
-        running = ''
-        try:
-            # Linux/Unix
-            running = subprocess.check_output(["ps", "axw"], universal_newlines=True)
-        except subprocess.CalledProcessError:
-            # Windows
-            running = subprocess.Popen(["tasklist", "/v"], universal_newlines=True)
-
-        if process in running:
-            return True
-
-        return False
-
     def __get_desktop_hint(self, hint="gnome"):
-
-        desktop = hint
-
-        if os.environ.get('KDE_FULL_SESSION') == 'true':
-            desktop = 'kde'
-
-        elif os.environ.get('GNOME_DESKTOP_SESSION_ID'):
-            desktop = 'gnome'
-
-        elif self.__is_running("xfce-mcs-manage") or self.__is_running('xfce4-session'):
-            desktop = 'xfce'
-
-        elif self.__is_running("ksmserver"):
-            desktop = 'kde'
-
-        return desktop
+        return _probe_desktop(hint)
 
     def __get_desktop_toolkit_hint(self, hint):
         toolkit = hint
@@ -210,18 +288,33 @@ class LensApp:
     def __load_toolkit(self, toolkit=None, toolkit_hint='gtk'):
         # determine the preferred toolkit to use and build the appropriate LensView
         if toolkit is None:
-            toolkit = self.__get_desktop_toolkit_hint(toolkit_hint.lower())
+            with tracer.span('toolkit hint'):
+                toolkit = self.__get_desktop_toolkit_hint(toolkit_hint.lower())
 
         # attempt to load the preferred
-        toolkit_klass = LensApp.__get_toolkit(toolkit.lower())
+        with tracer.span('toolkit import'):
+            toolkit_klass = LensApp.__get_toolkit(toolkit.lower())
+
         logger.debug('Using {0} toolkit'.format(toolkit.lower()))
 
-        self._lv = toolkit_klass(name=self._app_name, width=self._app_width,
-                                 height=self._app_height, inspector=self._inspector,
-                                 start_maximized=self._start_maximized)
+        with tracer.span('view'):
+            self._lv = toolkit_klass(name=self._app_name, width=self._app_width,
+                                     height=self._app_height, inspector=self._inspector,
+                                     start_maximized=self._start_maximized)
+
+        self._lv.set_js_batching(self._batch_emits)
+
+        self._lv.metrics.enabled = bool(self._metrics or self._metrics_dump)
+        if self._metrics_dump:
+            self._lv.metrics.start_dump(self._metrics_dump)
 
         #: set system theme
-        self._lv.set_system_theme(self.__get_desktop_theme())
+        with tracer.span('theme lookup'):
+            self._lv.set_system_theme(self.__get_desktop_theme())
+
+        #: write the startup trace once the app has loaded
+        if tracer.enabled:
+            self._lv.once('app.loaded', self._app_loaded_trace_cb)
 
         self._lv.set_uri_lens_base(self._uri_base + '/')
 
@@ -230,6 +323,19 @@ class LensApp:
         #: store an app reference to the thread manager
         self.threads = self._lv._manager
 
+        if self._thread_pool:
+            self.threads.use_pool(None if self._thread_pool is True else self._thread_pool)
+
+        #: handlers answering window.lens.call()
+        self._rpc = RPC(self._lv)
+
+        #: system information collected off the main loop
+        self._system = SystemInfo(self.threads, self._lv)
+
+    def _app_loaded_trace_cb(self, *args):
+        tracer.instant('app.loaded')
+        tracer.write()
+
     @property
     def inspector(self):
         return self._inspector
@@ -252,6 +358,41 @@ class LensApp:
         # update window title on app name change
         self._lv.set_title(self._app_name)
 
+    @property
+    def metrics(self):
+        """The :class:`lens.metrics.BridgeMetrics` of the app's view. Example
+           usage::
+
+             app.metrics.enabled = True
+             print(app.metrics.to_dict()['in']['get-hostname'])
+        """
+        return self._lv.metrics
+
+    @property
+    def system(self):
+        """The :class:`lens.system.SystemInfo` collecting system snapshots off
+           the main loop. Example usage::
+
+             @app.bind('get-system')
+             def get_system_cb():
+               app.system.snapshot_async(lambda info: app.emit('update-system', info))
+
+           or from a coroutine, eg. an async RPC handler::
+
+             info = await asyncio.wrap_future(app.system.snapshot_async())
+
+        The latest snapshot is available immediately from
+        `app.system.cached` while a refresh is in flight.
+        """
+        return self._system
+
+    @property
+    def watchdog(self):
+        """The :class:`lens.watchdog.Watchdog` measuring signal handlers, or
+           `None` if disabled.
+        """
+        return self._watchdog
+
     # DEPRECATE:
     # remove "manager" property in 1.0.0
     @property
@@ -276,9 +417,51 @@ class LensApp:
 
         return decorator
 
+    def blob(self, data, content_type='application/octet-stream', once=True):
+        """Makes a binary buffer available to the UI without a JSON round
+           trip and returns its URI. Example usage::
+
+             app.emit('update-chart', app.blob(array.array('d', samples)))
+
+           and in JS::
+
+             window.lens.fetch_blob(uri, 'Float64Array').then(function(samples) {
+               ...
+             });
+
+        Blobs are served by the Gtk3 backend's lens:// scheme handler,
+        other backends raise :exc:`NotImplementedError`.
+
+        :param data: bytes, array.array, numpy array or any other object
+                     supporting the buffer protocol. It is referenced, not
+                     copied, and must not be modified until fetched.
+        :param content_type: the content type the blob is served with
+        :param once: release the blob once it has been fetched. Otherwise
+                     it is held until :meth:`release_blob` is called.
+        """
+        if not self._lv.serves_blobs:
+            raise NotImplementedError('Blobs are not supported by the {0} backend.'.format(type(self._lv).__name__))
+
+        return self._lv.blobs.put(data, content_type, once)
+
     def close(self):
         self._lv.close()
 
+    def coalesce(self, name, key=None):
+        """Only deliver the latest value of a signal emitted to the UI within
+           a batch, dropping superseded values. Example usage::
+
+             app.coalesce('long-task-progress', key=lambda uuid, p: uuid)
+
+        Only applies when the app was created with `batch_emits=True`.
+
+        :param name: the name of the signal to coalesce
+        :param key: optional function receiving the signal arguments and
+                    returning the key values are superseded by. Defaults to
+                    the signal name alone.
+        """
+        self._lv.coalesce_js(name, key)
+
     # DEPRECATE:
     # remove "connect" method in 1.0.0
     def connect(self, name):
@@ -345,11 +528,20 @@ class LensApp:
         logger.warn('DEPRECATED: "load_ui" no longer required.')
 
     def on(self, name, callback):
+        if self._watchdog is not None:
+            callback = self._watchdog.wrap(name, callback)
+
         self._lv.on(name, callback)
 
     def once(self, name, callback):
+        if self._watchdog is not None:
+            callback = self._watchdog.wrap(name, callback)
+
         self._lv.once(name, callback)
 
+    def release_blob(self, uri):
+        self._lv.blobs.release(uri)
+
     def resize(self, width, height):
         """Resizes the application window.
 
@@ -366,6 +558,63 @@ class LensApp:
 
         self._lv.set_size(self._app_width, self._app_height)
 
+    def rpc(self, name, executor=None):
+        """A decorator that is used to register a handler answering calls
+           made with `window.lens.call()`. Example usage::
+
+             @app.rpc('get-hostname')
+             def get_hostname():
+               return os.uname()[1]
+
+           and in JS::
+
+             window.lens.call('get-hostname').then(function(hostname) {
+               ...
+             });
+
+        The promise resolves with the handler's return value, or rejects
+        with any exception raised. Handlers may be coroutine functions,
+        which are run on the thread manager's asyncio loop.
+
+        :param name: the name of the call to answer
+        :param executor: optional Thread executor ("thread", "process",
+                         "asyncio") to run the handler on instead of the
+                         main loop
+        """
+
+        def decorator(f):
+            self._rpc.register(name, f, executor)
+            return f
+
+        return decorator
+
+    def route(self, path, content_type=None):
+        """A decorator that is used to register a dynamic app:// route
+           serving Python generated content. Example usage::
+
+             @app.route('/export.csv', content_type='text/csv')
+             def export_csv(limit='100'):
+               for row in rows(int(limit)):
+                 yield ','.join(row) + '\\n'
+
+           The route is then available to the UI at `app:///export.csv`,
+           with any query parameters passed as keyword arguments.
+
+        Responses are streamed by the Gtk3 backend. Handlers are called on
+        the main loop while generators and file-like objects are consumed
+        on a worker thread.
+
+        :param path: the path of the route
+        :param content_type: the content type of the response. Guessed from
+                             the path when not given.
+        """
+
+        def decorator(f):
+            self._lv.routes.add(path, f, content_type)
+            return f
+
+        return decorator
+
     def set_title(self, title):
         self._lv.set_title(title)
 
@@ -383,7 +632,9 @@ class LensApp:
             if os.path.exists(_uri):
                 logger.debug('Loading URI: {0}'.format(_uri))
 
-                self._lv.load_uri(_uri)
+                with tracer.span('load uri'):
+                    self._lv.load_uri(_uri)
+
                 self._lv._run()
                 exit(0)
 
@@ -15,19 +15,22 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
-import json
 import logging
 import os
 import signal
+import threading
 
+from lens.blob import BLOB_URI
+from lens.resource import ResourceCache, iter_chunks, resolve_app, resolve_lens
 from lens.thread import ThreadManager
+from lens.tracer import tracer
 from lens.view import View
 
 # GTK
 from utils.dbus_proxy import DBusGMainLoop
 import gi
 gi.require_version('WebKit2', '4.0')
-from gi.repository import WebKit2, Gio, Gtk, GObject, Gdk
+from gi.repository import WebKit2, Gio, GLib, Gtk, GObject, Gdk
 
 logger = logging.getLogger('Lens.Backend.Gtk3')
 
@@ -38,17 +41,19 @@ class ThreadManagerGtk(ThreadManager):
     # watch the queue for updates
     _fd = self.queue_in._reader.fileno()
 
-    GObject.io_add_watch(_fd, GObject.IO_IN, self._on_cb)
+    # drain below redraw priority so a busy queue can't starve the UI
+    GObject.io_add_watch(_fd, GObject.PRIORITY_DEFAULT_IDLE, GObject.IO_IN, self._on_cb)
 
-  def _on_cb(self, fd, cond):
-    while not self.queue_in.empty():
-      data = self.queue_in.get()
+  def _call_soon(self, callback, *args):
+    GObject.idle_add(self._idle_cb, callback, args)
 
-      if data['name'] == '__completed':
-        self._thread_completed(self.threads[data['uuid']]['t'])
+  def _idle_cb(self, callback, args):
+    callback(*args)
+    return False
 
-      else:
-        self.emit('__thread_%s_%s' % (data['uuid'], data['name']), self.threads[data['uuid']], *data['args'])
+  def _on_cb(self, fd, cond):
+    # the watch fires again if messages remain after the drain budget
+    self._drain()
 
     return True
 
@@ -58,7 +63,7 @@ class _WebView(WebKit2.WebView):
   """
 
   __gsignals__ = {
-    'on-js': (GObject.SIGNAL_RUN_LAST, None, (GObject.TYPE_STRING,GObject.TYPE_PYOBJECT,))
+    'on-js-message': (GObject.SIGNAL_RUN_LAST, None, (GObject.TYPE_STRING,))
   }
 
   def __init__(self, inspector=False):
@@ -69,11 +74,26 @@ class _WebView(WebKit2.WebView):
     self._uri_app_base = '/'
     self._uri_lens_base = '/'
 
+    # in memory cache of app:// and lens:// resources
+    self._resources = ResourceCache(wrap=self._wrap_resource)
+
+    # binary buffers served at lens://blob/<id>, set by the view
+    self.blobs = None
+
+    # dynamic app:// routes, set by the view
+    self.routes = None
+
     # register signals
     self.connect('decide-policy', self._decide_policy_cb)
     self.connect('load-changed', self._load_changed_cb)
     self.connect('notify::title', self._title_changed_cb)
 
+    # register the "lens" script message handler for the JS bridge, the
+    # title bridge remains as a fallback
+    ucm = self.get_user_content_manager()
+    if ucm.register_script_message_handler('lens'):
+      ucm.connect('script-message-received::lens', self._script_message_cb)
+
     # register custom uri schemes for app:// and lens://
     context = WebKit2.WebContext.get_default()
     context.register_uri_scheme('app', self._uri_resource_app_cb)
@@ -115,6 +135,17 @@ class _WebView(WebKit2.WebView):
   def _load_changed_cb(self, view, event):
     pass
 
+  def _script_message_cb(self, manager, js_result):
+    try:
+      _in = js_result.get_js_value().to_string()
+
+    except:
+      logger.debug('Unable to read script message.')
+      return
+
+    # emit our python/js bridge signal
+    self.emit('on-js-message', _in)
+
   def _title_changed_cb(self, view, event):
     _in = view.get_title()
 
@@ -123,51 +154,102 @@ class _WebView(WebKit2.WebView):
     if _in is None or not _in.startswith('_BR::'):
       return
 
-    try:
-      _in = json.loads(_in[5:])
+    # emit our python/js bridge signal
+    self.emit('on-js-message', _in[5:])
+
+  @staticmethod
+  def _wrap_resource(path, data):
+    # preload into GLib.Bytes once so requests are served without copies
+    return (GLib.Bytes.new(data), Gio.content_type_guess(path, data)[0])
 
-      _name = _in.setdefault('name', '')
-      _args = _in.setdefault('args', [])
+  def _finish_resource(self, request, path):
+    with tracer.span(path, 'resource'):
+      resource = self._resources.get(path)
 
-      # emit our python/js bridge signal
-      self.emit('on-js', _name, _args)
+    if resource is None:
+      return False
+
+    data, content_type = resource
+    request.finish(Gio.MemoryInputStream.new_from_bytes(data), data.get_size(), content_type)
+
+    return True
+
+  @staticmethod
+  def _pump_route(fd, chunks):
+    try:
+      with open(fd, 'wb') as f:
+        for chunk in chunks:
+          f.write(chunk)
+
+    except BrokenPipeError:
+      logger.debug('App route stream closed by the view')
 
     except:
-      pass
+      logger.exception('App route stream failed')
 
-  def _uri_resource_app_cb(self, request):
-    path = o = request.get_uri().split('?')[0]
+  def _stream_route(self, request, route):
+    handler, content_type, params = route
 
-    if path == 'app:///':
-      path = self._uri_app_base + 'app.html'
+    try:
+      with tracer.span(request.get_uri(), 'route'):
+        body = handler(**params)
 
-    else:
-      path = path.replace('app://', self._uri_app_base)
+    except Exception as e:
+      logger.exception('App route failed: %s', request.get_uri())
+
+      # finish the request so the page sees an error rather than hang
+      request.finish_error(GLib.Error.new_literal(Gio.io_error_quark(), str(e), Gio.IOErrorEnum.FAILED))
+      return
 
-      # variable substitution
-      path = path.replace('$backend', 'gtk3')
+    # hand open files to WebKit directly
+    try:
+      stream = Gio.UnixInputStream.new(os.dup(body.fileno()), True)
+      body.close()
 
-    logger.debug('Loading app resource: {0} ({1})'.format(o, path))
+    except (AttributeError, OSError, ValueError):
+      # stream everything else through a pipe, fed from a worker thread so
+      # the pipe buffer bounds memory use and the main loop isn't blocked
+      r, w = os.pipe()
+      stream = Gio.UnixInputStream.new(r, True)
 
-    if os.path.exists(path):
-      request.finish(Gio.File.new_for_path(path).read(None), -1, Gio.content_type_guess(path, None)[0])
+      threading.Thread(target=self._pump_route, args=(w, iter_chunks(body)), daemon=True).start()
 
-    else:
+    request.finish(stream, -1, content_type)
+
+  def _uri_resource_app_cb(self, request):
+    o = request.get_uri()
+    route = self.routes.match(o) if self.routes is not None else None
+
+    if route is not None:
+      logger.debug('Streaming app route: %s', o)
+      self._stream_route(request, route)
+      return
+
+    path = resolve_app(o, self._uri_app_base, 'gtk3')
+
+    logger.debug('Loading app resource: %s (%s)', o, path)
+
+    if not self._finish_resource(request, path):
       raise Exception('App resource path not found: {0}'.format(path))
 
   def _uri_resource_lens_cb(self, request):
-    path = o = request.get_uri().split('?')[0]
-    path = path.replace('lens://', self._uri_lens_base)
+    o = request.get_uri()
 
-    # make lens.css backend specific
-    path = path.replace('lens.css', 'lens-gtk3.css')
+    if o.startswith(BLOB_URI):
+      blob = self.blobs.get(o) if self.blobs is not None else None
 
-    logger.debug('Loading lens resource: {0} ({1})'.format(o, path))
+      if blob is None:
+        raise Exception('Lens blob not found: {0}'.format(o))
 
-    if os.path.exists(path):
-      request.finish(Gio.File.new_for_path(path).read(None), -1, Gio.content_type_guess(path, None)[0])
+      data, content_type = blob
+      request.finish(Gio.MemoryInputStream.new_from_bytes(GLib.Bytes.new(bytes(data))), data.nbytes, content_type)
+      return
 
-    else:
+    path = resolve_lens(o, self._uri_lens_base, 'gtk3')
+
+    logger.debug('Loading lens resource: %s (%s)', o, path)
+
+    if not self._finish_resource(request, path):
       raise Exception('Lens resource path not found: {0}'.format(path))
 
   def set_inspector(self, state):
@@ -190,12 +272,13 @@ class _WebView(WebKit2.WebView):
 
 
 class ViewGtk(View):
-
+  serves_blobs = True
 
   def __init__(self, name="MyLensApp", width=640, height=480, inspector=False, start_maximized=False, *args, **kwargs):
     View.__init__(self, name=name, width=width, height=height, *args, **kwargs)
     # prepare Gtk DBus mainloop
-    DBusGMainLoop(set_as_default=True)
+    with tracer.span('DBusGMainLoop'):
+      DBusGMainLoop(set_as_default=True)
 
     self._app_loaded = False
 
@@ -205,18 +288,22 @@ class ViewGtk(View):
     self._inspector = inspector
     self._start_maximized = start_maximized
     self._window_state = {}
-    self._build_app()
+
+    with tracer.span('build app'):
+      self._build_app()
 
   def _build_app(self):
     # build window and webkit container
     self._window = w = Gtk.Window()
     self._lensview = lv = _WebView(inspector=self._inspector)
+    lv.blobs = self._blobs
+    lv.routes = self._routes
 
     # add lensview to the parent window
     w.add(lv)
 
     # connect to Gtk signals
-    lv.connect('on-js', self._on_js)
+    lv.connect('on-js-message', self._js_message_cb)
     lv.connect('load-changed', self._load_change_cb)
     w.connect('delete-event', self._delete_event_cb)
     w.connect('window-state-event', self._window_state_event_cb)
@@ -234,6 +321,9 @@ class ViewGtk(View):
     self.emit('app.close')
     Gtk.main_quit(*args)
 
+  def _js_message_cb(self, view, data):
+    self._on_js_message(data)
+
   def _delete_event_cb(self, *args):
     self.emit('__close_app', *args)
 
@@ -244,7 +334,8 @@ class ViewGtk(View):
   def _load_change_cb(self, view, event):
     # show window once some page has loaded
     if( event == WebKit2.LoadEvent.FINISHED ):
-      self._window.show_all()
+      with tracer.span('show window'):
+        self._window.show_all()
       if self._start_maximized:
         self.toggle_window_maximize()
       if not self._app_loaded:
@@ -255,8 +346,11 @@ class ViewGtk(View):
     signal.signal(signal.SIGINT, signal.SIG_DFL)
     Gtk.main()
 
-  def emit_js(self, name, *args):
-    self._lensview.run_javascript(self._javascript % json.dumps([name] + list(args)), None, None, None)
+  def _run_js(self, script):
+    self._lensview.run_javascript(script, None, None, None)
+
+  def _schedule_js_flush(self):
+    GObject.idle_add(self._flush_js)
 
   def load_uri(self, uri):
     # TODO: we require webkitgtk3 2.2.7 or later
@@ -21,6 +21,7 @@ import os
 import signal
 
 from lens.thread import ThreadManager
+from lens.tracer import tracer
 from lens.view import View
 
 # GTK
@@ -38,17 +39,19 @@ class ThreadManagerGtk(ThreadManager):
     # watch the queue for updates
     _fd = self.queue_in._reader.fileno()
 
-    GObject.io_add_watch(_fd, GObject.IO_IN, self._on_cb)
+    # drain below redraw priority so a busy queue can't starve the UI
+    GObject.io_add_watch(_fd, GObject.PRIORITY_DEFAULT_IDLE, GObject.IO_IN, self._on_cb)
 
-  def _on_cb(self, fd, cond):
-    while not self.queue_in.empty():
-      data = self.queue_in.get()
+  def _call_soon(self, callback, *args):
+    GObject.idle_add(self._idle_cb, callback, args)
 
-      if data['name'] == '__completed':
-        self._thread_completed(self.threads[data['uuid']]['t'])
+  def _idle_cb(self, callback, args):
+    callback(*args)
+    return False
 
-      else:
-        self.emit('__thread_%s_%s' % (data['uuid'], data['name']), self.threads[data['uuid']], *data['args'])
+  def _on_cb(self, fd, cond):
+    # the watch fires again if messages remain after the drain budget
+    self._drain()
 
     return True
 
@@ -129,7 +132,8 @@ class ViewGtk2(View):
   def __init__(self, name="MyLensApp", width=640, height=480, inspector=False, *args, **kwargs):
     View.__init__(self, name=name, width=width, height=height, *args, **kwargs)
     # prepare Gtk DBus mainloop
-    DBusGMainLoop(set_as_default=True)
+    with tracer.span('DBusGMainLoop'):
+      DBusGMainLoop(set_as_default=True)
 
     self._app_loaded = False
 
@@ -137,8 +141,13 @@ class ViewGtk2(View):
     self._manager = ThreadManagerGtk()
     self._uri_lens_base = None
 
+    # broadcast directly on the angular root scope
+    self._javascript = 'var _rs = angular.element(document).scope(); _rs.safeApply(function(){_rs.$broadcast.apply(_rs,%s)});'
+
     self._inspector = inspector
-    self._build_app()
+
+    with tracer.span('build app'):
+      self._build_app()
 
   def _build_app(self):
     # build window and webkit container
@@ -188,8 +197,11 @@ class ViewGtk2(View):
     signal.signal(signal.SIGINT, signal.SIG_DFL)
     Gtk.main()
 
-  def emit_js(self, name, *args):
-    self._lensview.execute_script('var _rs = angular.element(document).scope(); _rs.safeApply(function(){_rs.$broadcast.apply(_rs,%s)});' % json.dumps([name] + list(args)))
+  def _run_js(self, script):
+    self._lensview.execute_script(script)
+
+  def _schedule_js_flush(self):
+    GObject.idle_add(self._flush_js)
 
   def load_uri(self, uri):
     # improve resource handling of lens:// schemas by intercepting resources
@@ -15,18 +15,20 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
-import json
 import logging
 import os
 import signal
 
+from lens.resource import resolve_app, resolve_lens
 from lens.thread import ThreadManager
+from lens.tracer import tracer
 from lens.view import View
 
 logger = logging.getLogger('Lens.Backend.Qt4')
 
 # Qt4
 from utils.dbus_proxy import DBusQtMainLoop
+from PyQt4.QtCore import QObject, QTimer, pyqtSignal
 from PyQt4.QtWebKit import *
 from PyQt4.QtNetwork import QNetworkAccessManager
 
@@ -37,11 +39,24 @@ except ImportError:
   QString = type("")
 
 
+class _Invoker(QObject):
+  # queued across threads, so callbacks always run on the main loop
+  invoke = pyqtSignal(object, object)
+
+  def __init__(self):
+    QObject.__init__(self)
+    self.invoke.connect(self._invoke_cb)
+
+  def _invoke_cb(self, callback, args):
+    callback(*args)
+
+
 class ThreadManagerQt4(ThreadManager):
   def __init__(self, app=None, maxConcurrentThreads=10):
     ThreadManager.__init__(self, maxConcurrentThreads)
 
     self._app = app
+    self._invoker = _Invoker()
 
     if self._app is not None:
 
@@ -51,15 +66,12 @@ class ThreadManagerQt4(ThreadManager):
       _notifier = QSocketNotifier(_fd, QSocketNotifier.Read, self._app)
       _notifier.activated.connect(self._on_cb)
 
-  def _on_cb(self, fd):
-    while not self.queue_in.empty():
-      data = self.queue_in.get()
-
-      if data['name'] == '__completed':
-        self._thread_completed(self.threads[data['uuid']]['t'])
+  def _call_soon(self, callback, *args):
+    self._invoker.invoke.emit(callback, args)
 
-      else:
-        self.emit('__thread_%s_%s' % (data['uuid'], data['name']), self.threads[data['uuid']], *data['args'])
+  def _on_cb(self, fd):
+    # the notifier fires again if messages remain after the drain budget
+    self._drain()
 
     return True
 
@@ -74,24 +86,13 @@ class CustomNetworkAccessManager(QNetworkAccessManager):
     path = o = request.url().toString()
 
     if path.startswith('app://') or path.startswith('lens://'):
-      if path == 'app:///':
-        path = 'file://' + self._uri_app_base + 'app.html'
-        logger.debug('Loading app resource: {0} ({1})'.format(o, path))
-
-      elif path.startswith('app://'):
-        path = path.replace('app://', 'file://' + self._uri_app_base)
-        logger.debug('Loading app resource: {0} ({1})'.format(o, path))
-
-        # variable substitution
-        path = path.replace('$backend', 'qt4')
+      if path.startswith('app://'):
+        path = resolve_app(path, 'file://' + self._uri_app_base, 'qt4')
+        logger.debug('Loading app resource: %s (%s)', o, path)
 
-      elif path.startswith('lens://'):
-        path = path.replace('lens://', 'file://' + self._uri_lens_base)
-
-        # make lens.css backend specific
-        path = path.replace('lens.css', 'lens-qt4.css')
-
-        logger.debug('Loading lens resource: {0} ({1})'.format(o, path))
+      else:
+        path = resolve_lens(path, 'file://' + self._uri_lens_base, 'qt4')
+        logger.debug('Loading lens resource: %s (%s)', o, path)
 
       request.setUrl(QUrl(QString(path)))
 
@@ -133,8 +134,11 @@ class ViewQt4(View):
   def __init__(self, name="MyLensApp", width=640, height=480, inspector=False, start_maximized=False, *args, **kwargs):
     View.__init__(self, name=name, width=width,height=height, *args, **kwargs)
     # prepare Qt DBus mainloop
-    DBusQtMainLoop(set_as_default=True)
-    self._app = QApplication([])
+    with tracer.span('DBusQtMainLoop'):
+      DBusQtMainLoop(set_as_default=True)
+
+    with tracer.span('QApplication'):
+      self._app = QApplication([])
 
     self._app_loaded = False
 
@@ -142,7 +146,9 @@ class ViewQt4(View):
 
     self._inspector = inspector
     self._start_maximized = start_maximized
-    self._build_app()
+
+    with tracer.span('build app'):
+      self._build_app()
 
   def _build_app(self):
     # build webkit container
@@ -201,24 +207,18 @@ class ViewQt4(View):
     if _in is None or not _in.startswith('_BR::'):
       return
 
-    try:
-      _in = json.loads(_in[5:])
-
-      _name = _in.setdefault('name', '')
-      _args = _in.setdefault('args', [])
-
-    except:
-      return
-
     # emit our python/js bridge signal
-    self.emit(_name, *_args)
+    self._on_js_message(_in[5:])
 
   def _run(self):
     signal.signal(signal.SIGINT, signal.SIG_DFL)
     self._app.exec_()
 
-  def emit_js(self, name, *args):
-    self._frame.evaluateJavaScript(QString(self._javascript % json.dumps([name] + list(args))))
+  def _run_js(self, script):
+    self._frame.evaluateJavaScript(QString(script))
+
+  def _schedule_js_flush(self):
+    QTimer.singleShot(0, self._flush_js)
 
   def load_uri(self, uri):
     uri_base = os.path.dirname(uri) + '/'
@@ -15,12 +15,13 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
-import json
 import logging
 import os
 import signal
 
+from lens.resource import resolve_app, resolve_lens
 from lens.thread import ThreadManager
+from lens.tracer import tracer
 from lens.view import View
 
 # Qt5
@@ -35,11 +36,24 @@ from PyQt5.QtWebChannel import *
 logger = logging.getLogger('Lens.Backend.Qt5')
 
 
+class _Invoker(QObject):
+    # queued across threads, so callbacks always run on the main loop
+    invoke = pyqtSignal(object, object)
+
+    def __init__(self):
+        super(_Invoker, self).__init__()
+        self.invoke.connect(self._invoke_cb)
+
+    def _invoke_cb(self, callback, args):
+        callback(*args)
+
+
 class ThreadManagerQt5(ThreadManager):
     def __init__(self, app=None, max_concurrent_threads=10):
-        super(ThreadManagerQt5, self).__init__(self, max_concurrent_threads)
+        super(ThreadManagerQt5, self).__init__(max_concurrent_threads)
 
         self._app = app
+        self._invoker = _Invoker()
 
         if self._app is not None:
             # watch the queue for updates
@@ -48,16 +62,12 @@ class ThreadManagerQt5(ThreadManager):
             _notifier = QSocketNotifier(_fd, QSocketNotifier.Read, self._app)
             _notifier.activated.connect(self._on_cb)
 
-    def _on_cb(self, fd):
-        while not self.queue_in.empty():
-            data = self.queue_in.get()
-
-            if data['name'] == '__completed':
-                self._thread_completed(self.threads[data['uuid']]['t'])
+    def _call_soon(self, callback, *args):
+        self._invoker.invoke.emit(callback, args)
 
-            else:
-                self.emit('__thread_%s_%s' % (data['uuid'], data['name']),
-                          self.threads[data['uuid']], *data['args'])
+    def _on_cb(self, fd):
+        # the notifier fires again if messages remain after the drain budget
+        self._drain()
 
         return True
 
@@ -76,26 +86,26 @@ class CustomNetworkAccessManager(QObject):
     def process_request_url(self, request_url):
         path = req = str(request_url)
 
-        if path.startswith('app://') or path.startswith('lens://'):
-            if path == 'app:///':
-                path = 'file://' + self.uri_app_base + 'app.html'
-                logger.debug('Loading app resource: {0} ({1})'.format(req, path))
+        if path.startswith('app://'):
+            path = resolve_app(path, 'file://' + self.uri_app_base, 'qt5')
+            logger.debug('Loading app resource: %s (%s)', req, path)
 
-            elif path.startswith('app://'):
-                path = path.replace('app://', 'file://' + self.uri_app_base)
-                logger.debug('Loading app resource: {0} ({1})'.format(req, path))
+        elif path.startswith('lens://'):
+            path = resolve_lens(path, 'file://' + self.uri_lens_base, 'qt5')
+            logger.debug('Loading lens resource: %s (%s)', req, path)
 
-                # variable substitution
-                path = path.replace('$backend', 'qt5')
+        self.page.url_for_request.emit(path)
 
-            elif path.startswith('lens://'):
-                path = path.replace('lens://', 'file://' + self.uri_lens_base)
-                logger.debug('Loading lens resource: {0} ({1})'.format(req, path))
 
-                # make lens.css backend specific
-                path = path.replace('lens.css', 'lens-qt5.css')
+class LensBridge(QObject):
+    """
+    Receives bridge messages posted from JS over the QWebChannel.
+    """
+    message = pyqtSignal(str)
 
-        self.page.url_for_request.emit(path)
+    @pyqtSlot(str)
+    def post(self, data):
+        self.message.emit(data)
 
 
 class LensQWebEnginePage(QtWebEng.QWebEnginePage):
@@ -183,8 +193,11 @@ class LensViewQt5(View):
         super(LensViewQt5, self).__init__(name=name, width=width, height=height, *args, **kwargs)
 
         # prepare Qt DBus mainloop
-        DBusQtMainLoop(set_as_default=True)
-        self._app = QApplication(*args, **kwargs)
+        with tracer.span('DBusQtMainLoop'):
+            DBusQtMainLoop(set_as_default=True)
+
+        with tracer.span('QApplication'):
+            self._app = QApplication(*args, **kwargs)
 
         self._app_loaded = False
         self.view = None
@@ -195,7 +208,9 @@ class LensViewQt5(View):
 
         self.start_maximized = start_maximized
         self.inspector = inspector
-        self._build_app()
+
+        with tracer.span('build app'):
+            self._build_app()
 
     def _build_app(self):
         if self.inspector:
@@ -221,6 +236,14 @@ class LensViewQt5(View):
         self._cnam = CustomNetworkAccessManager(page=self.page)
         self.page.set_network_access_manager(self._cnam)
 
+        # expose the lens bridge object over the web channel, the title
+        # bridge remains as a fallback until the channel is ready
+        self._bridge = LensBridge()
+        self._bridge.message.connect(self._on_js_message)
+        self.channel.registerObject('lens', self._bridge)
+        self.page.setWebChannel(self.channel)
+        self._inject_web_channel()
+
         # connect to Lens signals
         self.on('__close_app', self._close_cb)
 
@@ -254,6 +277,24 @@ class LensViewQt5(View):
             self._app_loaded = True
             self.emit('app.loaded')
 
+    def _inject_web_channel(self):
+        stream = QFile(':/qtwebchannel/qwebchannel.js')
+        if not stream.open(QFile.ReadOnly):
+            logger.debug('Unable to load qwebchannel.js, using title bridge only.')
+            return
+
+        source = str(stream.readAll(), 'utf-8')
+        source += ('new QWebChannel(qt.webChannelTransport, function(channel) {'
+                   '  window.__lens_channel = channel.objects.lens;'
+                   '});')
+
+        script = QtWebEng.QWebEngineScript()
+        script.setName('lens-web-channel')
+        script.setSourceCode(source)
+        script.setInjectionPoint(QtWebEng.QWebEngineScript.DocumentCreation)
+        script.setWorldId(QtWebEng.QWebEngineScript.MainWorld)
+        self.page.scripts().insert(script)
+
     def _title_changed_cb(self, title):
         _in = str(title)
 
@@ -262,24 +303,18 @@ class LensViewQt5(View):
         if _in is None or not _in.startswith('_BR::'):
             return
 
-        try:
-            _in = json.loads(_in[5:])
-
-            _name = _in.setdefault('name', '')
-            _args = _in.setdefault('args', [])
-
-        except:
-            return
-
         # emit our python/js bridge signal
-        self.emit(_name, *_args)
+        self._on_js_message(_in[5:])
 
     def _run(self):
         signal.signal(signal.SIGINT, signal.SIG_DFL)
         self._app.exec_()
 
-    def emit_js(self, name, *args):
-        self.view.runJavaScript(str(self._javascript % json.dumps([name] + list(args))))
+    def _run_js(self, script):
+        self.view.runJavaScript(str(script))
+
+    def _schedule_js_flush(self):
+        QTimer.singleShot(0, self._flush_js)
 
     def load_uri(self, uri):
         uri_base = os.path.dirname(uri) + '/'
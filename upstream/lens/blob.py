@@ -0,0 +1,77 @@
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger('Lens.Blob')
+
+#: URI prefix blobs are served from by the lens:// scheme handler
+BLOB_URI = 'lens://blob/'
+
+
+class BlobStore():
+  """
+  Holds binary buffers (bytes, array.array, numpy arrays or anything else
+  supporting the buffer protocol) served to JS at lens://blob/<id>, where
+  window.lens.fetch_blob() loads them as an ArrayBuffer or typed array.
+
+  Buffers are referenced, not copied, so they must not be modified until
+  served. Blobs put with once=True are released after being served.
+  """
+  def __init__(self):
+    self._blobs = {}
+    self._ids = itertools.count(1)
+    self._lock = threading.Lock()
+
+  def get(self, uri):
+    """
+    Returns the (data, content_type) of the blob at uri, releasing it if
+    it was put with once=True, or None if it doesn't exist.
+    """
+    key = uri.split('?')[0][len(BLOB_URI):]
+
+    with self._lock:
+      blob = self._blobs.get(key)
+
+      if blob is None:
+        return None
+
+      if blob[2]:
+        del(self._blobs[key])
+
+    return blob[0], blob[1]
+
+  def put(self, data, content_type='application/octet-stream', once=True):
+    """
+    Stores data and returns the URI it is served at.
+    """
+    data = memoryview(data).cast('B')
+
+    with self._lock:
+      key = str(next(self._ids))
+      self._blobs[key] = (data, content_type, once)
+
+    return BLOB_URI + key
+
+  def release(self, uri):
+    with self._lock:
+      self._blobs.pop(uri.split('?')[0][len(BLOB_URI):], None)
+
+  def __len__(self):
+    return len(self._blobs)
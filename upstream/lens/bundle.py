@@ -0,0 +1,119 @@
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import sys
+
+logger = logging.getLogger('Lens.Bundle')
+
+#: manifest mapping logical bundle names to their content hashed files,
+#: relative to the lens data path
+MANIFEST = 'manifest.json'
+
+_VENDOR = ['jquery', 'angular', 'angular-route', 'angular-animate', 'bootstrap']
+
+#: bundles to build, relative to the lens data path
+BUNDLES = {
+  'js/lens.js':              ['js/lens-core.js'],
+  'js/lens.min.js':          ['js/lens-core.min.js'],
+  'js/lens-angular.js':      ['js/%s.js' % (v) for v in _VENDOR] +
+                             ['js/lens-core.js', 'js/lens-bridge.js', 'js/lens-ui.js'],
+  'js/lens-angular.min.js':  ['js/%s.min.js' % (v) for v in _VENDOR] +
+                             ['js/lens-core.min.js', 'js/lens-bridge.js', 'js/lens-ui.js'],
+}
+
+
+def _hashed_name(name, data):
+  root, ext = os.path.splitext(name)
+  return '%s.%s%s' % (root, hashlib.sha1(data).hexdigest()[:10], ext)
+
+def _write(path, data):
+  with open(path, 'wb') as f:
+    f.write(data)
+
+def build(base, bundles=BUNDLES):
+  """
+  Builds each bundle under the lens data path "base" and writes a content
+  hashed copy alongside it. The manifest mapping logical names to hashed
+  files is written to base and returned.
+  """
+  manifest = {}
+
+  previous = read_manifest(base)
+
+  for name in sorted(bundles):
+    data = b''
+
+    for source in bundles[name]:
+      with open(os.path.join(base, source), 'rb') as f:
+        data += f.read().rstrip() + b'\n'
+
+    hashed = _hashed_name(name, data)
+
+    # the logical name remains available for apps loading it directly
+    _write(os.path.join(base, name), data)
+    _write(os.path.join(base, hashed), data)
+
+    manifest[name] = hashed
+
+    logger.debug('Built bundle: {0} ({1})'.format(name, hashed))
+
+  # remove stale hashed bundles from a previous build
+  for name, hashed in previous.items():
+    if manifest.get(name) != hashed:
+      try:
+        os.unlink(os.path.join(base, hashed))
+      except OSError:
+        pass
+
+  with open(os.path.join(base, MANIFEST), 'w') as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+
+  read_manifest.cache_clear()
+
+  return manifest
+
+@functools.lru_cache(maxsize=8)
+def read_manifest(base):
+  """
+  Returns the bundle manifest for the lens data path "base", or an empty
+  manifest if no bundles have been built.
+  """
+  try:
+    with open(os.path.join(base, MANIFEST), 'r') as f:
+      return json.load(f)
+
+  except (OSError, IOError, ValueError):
+    return {}
+
+def resolve(base, name):
+  """
+  Returns the content hashed file for the logical bundle "name", or name if
+  it isn't a known bundle.
+  """
+  return read_manifest(base).get(name, name)
+
+
+if __name__ == '__main__':
+  logging.basicConfig(level=logging.DEBUG)
+
+  for name, hashed in sorted(build(sys.argv[1] if len(sys.argv) > 1 else 'lens-data').items()):
+    print('%s -> %s' % (name, hashed))
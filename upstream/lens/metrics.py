@@ -0,0 +1,173 @@
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger('Lens.Metrics')
+
+#: histogram buckets are powers of two microseconds, up to ~1s
+_BUCKETS = 21
+
+
+class Histogram():
+  """
+  A fixed size histogram of durations with power of two microsecond
+  buckets.
+  """
+  __slots__ = ('count', 'total', 'max', 'buckets')
+
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+    self.buckets = [0] * (_BUCKETS + 1)
+
+  def add(self, seconds):
+    self.count += 1
+    self.total += seconds
+
+    if seconds > self.max:
+      self.max = seconds
+
+    self.buckets[min(int(seconds * 1e6).bit_length(), _BUCKETS)] += 1
+
+  def percentile(self, p):
+    """
+    Returns the upper bound, in seconds, of the bucket holding the p-th
+    percentile.
+    """
+    if not self.count:
+      return 0.0
+
+    rank = p / 100.0 * self.count
+    seen = 0
+
+    for i, n in enumerate(self.buckets):
+      seen += n
+
+      if seen >= rank:
+        return min((1 << i) / 1e6, self.max)
+
+    return self.max
+
+  def to_dict(self):
+    return {
+      'count': self.count,
+      'mean':  self.total / self.count if self.count else 0.0,
+      'max':   self.max,
+      'p50':   self.percentile(50),
+      'p99':   self.percentile(99),
+    }
+
+
+
+class SignalMetrics():
+  __slots__ = ('count', 'bytes', 'codec', 'handler')
+
+  def __init__(self):
+    self.count = 0
+    self.bytes = 0
+    self.codec = Histogram()
+    self.handler = Histogram()
+
+  def to_dict(self, elapsed):
+    return {
+      'count':   self.count,
+      'rate':    self.count / elapsed if elapsed > 0 else 0.0,
+      'bytes':   self.bytes,
+      'codec':   self.codec.to_dict(),
+      'handler': self.handler.to_dict(),
+    }
+
+
+
+class BridgeMetrics():
+  """
+  Counts messages crossing the python/JS bridge per signal name and
+  direction: message rate, payload bytes, JSON encode/decode time and, for
+  messages from JS, the time spent in python handlers.
+  """
+  def __init__(self, enabled=False):
+    self.enabled = enabled
+
+    self._timer = None
+    self.reset()
+
+  def _signal(self, direction, name):
+    s = direction.get(name)
+
+    if s is None:
+      s = direction[name] = SignalMetrics()
+
+    return s
+
+  def record_in(self, name, nbytes, decode, handler):
+    s = self._signal(self._in, name)
+    s.count += 1
+    s.bytes += nbytes
+
+    if decode is not None:
+      s.codec.add(decode)
+
+    s.handler.add(handler)
+
+  def record_out(self, name, nbytes=0, encode=None):
+    s = self._signal(self._out, name)
+    s.count += 1
+    s.bytes += nbytes
+
+    if encode is not None:
+      s.codec.add(encode)
+
+  def reset(self):
+    self._start = time.monotonic()
+    self._in = {}
+    self._out = {}
+
+  def to_dict(self):
+    elapsed = time.monotonic() - self._start
+
+    return {
+      'elapsed': elapsed,
+      'in':  {k: v.to_dict(elapsed) for k, v in list(self._in.items())},
+      'out': {k: v.to_dict(elapsed) for k, v in list(self._out.items())},
+    }
+
+  def dump(self):
+    logger.info('Bridge metrics: %s', json.dumps(self.to_dict(), sort_keys=True))
+
+  def start_dump(self, interval):
+    """
+    Logs the metrics every interval seconds until stop_dump() is called.
+    """
+    self.stop_dump()
+
+    def _dump_cb():
+      self.dump()
+      self.start_dump(interval)
+
+    self._timer = threading.Timer(interval, _dump_cb)
+    self._timer.daemon = True
+    self._timer.start()
+
+  def stop_dump(self):
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
@@ -0,0 +1,222 @@
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import collections
+import functools
+import logging
+import mimetypes
+import os
+import urllib.parse
+
+from lens import bundle
+
+logger = logging.getLogger('Lens.Resource')
+
+
+@functools.lru_cache(maxsize=1024)
+def resolve_app(uri, base, backend):
+  """
+  Resolves an app:// URI to a path relative to the app base, substituting
+  the backend name for any "$backend" variable.
+  """
+  path = uri.split('?')[0]
+
+  if path == 'app:///':
+    return base + 'app.html'
+
+  path = path.replace('app://', base)
+
+  # variable substitution
+  return path.replace('$backend', backend)
+
+@functools.lru_cache(maxsize=1024)
+def resolve_lens(uri, base, backend):
+  """
+  Resolves a lens:// URI to a path relative to the lens data base, making
+  lens.css backend specific and mapping bundles to their content hashed
+  files when a bundle manifest exists.
+  """
+  path = uri.split('?')[0]
+  path = path.replace('lens://', '', 1)
+
+  root = base[7:] if base.startswith('file://') else base
+  path = base + bundle.resolve(root, path)
+
+  # make lens.css backend specific
+  return path.replace('lens.css', 'lens-%s.css' % (backend))
+
+
+
+class ResourceCache():
+  """
+  Caches resource contents in memory keyed by their resolved path. Entries
+  are validated against the file's mtime and size on every lookup and the
+  least recently used entries are evicted once the byte budget is exceeded.
+
+  An optional wrap(path, data) callable converts the contents once when
+  loaded, allowing backends to cache toolkit buffers (eg. GLib.Bytes)
+  that can be served without further copies.
+  """
+  def __init__(self, budget=32*1024*1024, wrap=None):
+    self._budget = budget
+    self._size = 0
+    self._wrap = wrap
+    self._entries = collections.OrderedDict()
+
+  def _drop(self, path):
+    entry = self._entries.pop(path, None)
+
+    if entry is not None:
+      self._size -= entry[1]
+
+  @property
+  def budget(self):
+    return self._budget
+
+  @budget.setter
+  def budget(self, budget):
+    self._budget = budget
+    self._evict()
+
+  @property
+  def size(self):
+    return self._size
+
+  def _evict(self):
+    while self._size > self._budget and self._entries:
+      path, entry = self._entries.popitem(last=False)
+      self._size -= entry[1]
+
+      logger.debug('Evicted resource: {0}'.format(path))
+
+  def clear(self):
+    self._entries.clear()
+    self._size = 0
+
+  def get(self, path):
+    """
+    Returns the (wrapped) contents of the resource at path, or None if it
+    does not exist.
+    """
+    try:
+      st = os.stat(path)
+
+    except OSError:
+      self._drop(path)
+      return None
+
+    entry = self._entries.get(path)
+
+    if entry is not None and entry[0] == (st.st_mtime_ns, st.st_size):
+      self._entries.move_to_end(path)
+      return entry[2]
+
+    self._drop(path)
+
+    try:
+      with open(path, 'rb') as f:
+        data = f.read()
+
+    except (OSError, IOError):
+      return None
+
+    size = len(data)
+
+    if self._wrap is not None:
+      data = self._wrap(path, data)
+
+    # resources larger than the whole budget are served but not kept
+    if size <= self._budget:
+      self._entries[path] = ((st.st_mtime_ns, st.st_size), size, data)
+      self._size += size
+      self._evict()
+
+    return data
+
+
+class Routes():
+  """
+  Registry of dynamic app:// routes serving Python generated content. A
+  handler is called with the request's query parameters as keyword
+  arguments and returns str, bytes, a file-like object or an iterable (eg.
+  a generator) of str/bytes chunks, which backends stream to the view
+  without building the whole response in memory.
+  """
+  def __init__(self):
+    self._routes = {}
+
+  @staticmethod
+  def _key(path):
+    return '/' + path.replace('app://', '', 1).lstrip('/')
+
+  def add(self, path, handler, content_type=None):
+    self._routes[self._key(path)] = (handler, content_type)
+
+  def remove(self, path):
+    self._routes.pop(self._key(path), None)
+
+  def match(self, uri):
+    """
+    Returns the (handler, content_type, params) of the route matching uri,
+    or None if no route is registered for it.
+    """
+    if not self._routes:
+      return None
+
+    path, _, query = uri.partition('?')
+    route = self._routes.get(self._key(path))
+
+    if route is None:
+      return None
+
+    content_type = route[1] or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    return route[0], content_type, dict(urllib.parse.parse_qsl(query))
+
+  def __len__(self):
+    return len(self._routes)
+
+
+def iter_chunks(body, size=64*1024):
+  """
+  Yields the response body returned by a route handler as bytes chunks.
+  """
+  if isinstance(body, str):
+    body = body.encode('utf-8')
+
+  if isinstance(body, (bytes, bytearray, memoryview)):
+    yield body
+    return
+
+  if hasattr(body, 'read'):
+    try:
+      while True:
+        chunk = body.read(size)
+
+        if not chunk:
+          break
+
+        yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+    finally:
+      if hasattr(body, 'close'):
+        body.close()
+
+    return
+
+  for chunk in body:
+    yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
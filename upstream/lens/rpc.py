@@ -0,0 +1,185 @@
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import asyncio
+import logging
+
+from lens.thread import Thread
+
+logger = logging.getLogger('Lens.RPC')
+
+
+def _error(e):
+  return '%s: %s' % (type(e).__name__, e)
+
+
+class RPCThread(Thread):
+  """
+  Runs an RPC handler on a ThreadManager executor, emitting its result, or
+  error, as the "rpc-result" signal.
+  """
+  def __init__(self, callback, args, executor):
+    Thread.__init__(self, daemon=True)
+
+    self.executor = executor
+
+    self._callback = callback
+    self._args = args
+
+  async def _await(self, coro):
+    try:
+      result = await coro
+
+    except Exception as e:
+      self.emit('rpc-result', _error(e), None)
+      return
+
+    self.emit('rpc-result', None, result)
+
+  def run(self):
+    try:
+      result = self._callback(*self._args)
+
+    except Exception as e:
+      self.emit('rpc-result', _error(e), None)
+      return
+
+    # coroutines are awaited by the "asyncio" executor, other executors
+    # run them on a loop of their own
+    if asyncio.iscoroutine(result):
+      if self.executor == 'asyncio':
+        return self._await(result)
+
+      asyncio.run(self._await(result))
+      return
+
+    self.emit('rpc-result', None, result)
+
+
+
+class RPC():
+  """
+  Answers window.lens.call() requests with the result of the handler
+  registered for the called name. Handlers are run on the main loop unless
+  registered with an executor (see Thread.executor), coroutines returned
+  by handlers are run on the ThreadManager's asyncio loop.
+
+  Calls are correlated by an id chosen by JS and replies are delivered to
+  the pending promise only, without broadcasting a signal.
+  """
+  def __init__(self, view):
+    self._view = view
+
+    self._handlers = {}
+
+    #: calls in flight, by id, mapped to a callable cancelling them if any
+    self._calls = {}
+
+    view.on('__rpc_call', self._call)
+    view.on('__rpc_cancel', self._cancel)
+
+  def _call(self, id, name, args=None):
+    self._calls[id] = None
+
+    handler = self._handlers.get(name)
+
+    if handler is None:
+      self._reply(id, 'Unknown RPC method "%s"' % (name), None)
+      return
+
+    callback, executor = handler
+    manager = self._view._manager
+
+    if executor is not None:
+      thread = RPCThread(callback, args or [], executor)
+
+      manager.on(thread, 'rpc-result', lambda t, error, result: self._reply(id, error, result))
+      manager.on(thread, 'failed', lambda t: self._reply(id, 'Unable to start RPC method "%s"' % (name), None))
+
+      try:
+        manager.add(thread)
+
+      except ValueError as e:
+        manager.unsubscribe_namespace(thread.uuid)
+        self._reply(id, _error(e), None)
+        return
+
+      if id not in self._calls:
+        return
+
+      self._calls[id] = lambda: manager.cancel(thread)
+      return
+
+    try:
+      result = callback(*(args or []))
+
+    except Exception as e:
+      self._reply(id, _error(e), None)
+      return
+
+    if not asyncio.iscoroutine(result):
+      self._reply(id, None, result)
+      return
+
+    future = asyncio.run_coroutine_threadsafe(result, manager._asyncio_loop())
+    future.add_done_callback(lambda f: manager._call_soon(self._done, id, f))
+
+    self._calls[id] = future.cancel
+
+  def _cancel(self, id):
+    cancel = self._calls.pop(id, None)
+
+    logger.debug('Cancelling RPC call %s', id)
+
+    if cancel is not None:
+      cancel()
+
+  def _done(self, id, future):
+    if future.cancelled():
+      return
+
+    e = future.exception()
+
+    if e is not None:
+      self._reply(id, _error(e), None)
+
+    else:
+      self._reply(id, None, future.result())
+
+  def _reply(self, id, error, result):
+    # drop replies to calls cancelled, or timed out, in JS
+    if id not in self._calls:
+      return
+
+    del(self._calls[id])
+
+    try:
+      self._view.reply_js(id, error, result)
+
+    except (TypeError, ValueError, OverflowError) as e:
+      logger.warning('Unable to encode reply to RPC call %s: %s', id, e)
+      self._view.reply_js(id, _error(e), None)
+
+  @property
+  def pending(self):
+    return len(self._calls)
+
+  def register(self, name, callback, executor=None):
+    self._handlers[name] = (callback, executor)
+
+  def unregister(self, name):
+    self._handlers.pop(name, None)
@@ -0,0 +1,177 @@
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import base64
+import datetime
+import decimal
+import json
+import logging
+import math
+import os
+import uuid
+
+logger = logging.getLogger('Lens.Serializer')
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+try:
+  import ujson
+except ImportError:
+  ujson = None
+
+
+def _default(obj):
+  """
+  Converts types JSON has no representation for.
+  """
+  if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+    return obj.isoformat()
+
+  if isinstance(obj, (bytes, bytearray, memoryview)):
+    return base64.b64encode(obj).decode('ascii')
+
+  if isinstance(obj, (set, frozenset)):
+    return list(obj)
+
+  if isinstance(obj, decimal.Decimal):
+    return float(obj)
+
+  if isinstance(obj, uuid.UUID):
+    return str(obj)
+
+  # numpy arrays and scalars, without importing numpy
+  if hasattr(obj, 'dtype') and hasattr(obj, 'tolist'):
+    return obj.tolist()
+
+  raise TypeError('Object of type %s is not JSON serializable' % (type(obj).__name__))
+
+
+def _non_finite(obj, _isfinite=math.isfinite):
+  """
+  Returns True if obj holds a NaN or Infinity float, walking nested
+  dicts, lists and tuples.
+  """
+  t = type(obj)
+
+  if t is float:
+    return not _isfinite(obj)
+
+  if t is dict:
+    obj = obj.values()
+
+  elif t is not list and t is not tuple:
+    return False
+
+  for v in obj:
+    t = type(v)
+
+    if t is float:
+      if not _isfinite(v):
+        return True
+
+    elif (t is dict or t is list or t is tuple) and _non_finite(v):
+      return True
+
+  return False
+
+
+class Serializer():
+  """
+  Encodes and decodes messages crossing the python/JS bridge with the
+  standard library json module.
+  """
+  name = 'json'
+
+  def dumps(self, obj):
+    return json.dumps(obj, default=_default, separators=(',', ':'))
+
+  def loads(self, data):
+    return json.loads(data)
+
+
+class OrjsonSerializer(Serializer):
+  name = 'orjson'
+
+  def dumps(self, obj):
+    # orjson writes NaN and Infinity as null where json writes the JS
+    # literals, leave those payloads to json
+    if _non_finite(obj):
+      return Serializer.dumps(self, obj)
+
+    try:
+      data = orjson.dumps(obj, default=_default,
+                          option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+    except orjson.JSONEncodeError:
+      # eg. integers beyond 64 bit, which json encodes
+      return Serializer.dumps(self, obj)
+
+    data = data.decode('utf-8')
+
+    # unlike json, orjson doesn't escape the line separators that older JS
+    # engines reject in string literals
+    if '\u2028' in data or '\u2029' in data:
+      data = data.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+    return data
+
+  def loads(self, data):
+    return orjson.loads(data)
+
+
+class UjsonSerializer(Serializer):
+  name = 'ujson'
+
+  def dumps(self, obj):
+    try:
+      return ujson.dumps(obj, default=_default, reject_bytes=True)
+
+    except (TypeError, OverflowError):
+      # older ujson releases lack "default", use the standard library
+      return Serializer.dumps(self, obj)
+
+  def loads(self, data):
+    return ujson.loads(data)
+
+
+#: serializers by name, in order of preference
+SERIALIZERS = {
+  'orjson': OrjsonSerializer if orjson is not None else None,
+  'ujson':  UjsonSerializer if ujson is not None else None,
+  'json':   Serializer,
+}
+
+def get_serializer(name=None):
+  """
+  Returns the named serializer, LENS_SERIALIZER if set, or the fastest
+  available one.
+  """
+  name = name or os.environ.get('LENS_SERIALIZER')
+
+  if name:
+    if SERIALIZERS.get(name) is None:
+      raise ValueError('Serializer %s is not available.' % (name))
+
+    return SERIALIZERS[name]()
+
+  for name in ['orjson', 'ujson', 'json']:
+    if SERIALIZERS[name] is not None:
+      logger.debug('Using {0} serializer'.format(name))
+      return SERIALIZERS[name]()
@@ -15,15 +15,298 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
-import locale
+import array
+import concurrent.futures
+import functools
+import logging
 import os
+import pwd
 import re
+import resource
+import threading
+import time
+
+from lens.thread import Thread
+
+logger = logging.getLogger('Lens.System')
+
+_CPU_PATH = '/sys/devices/system/cpu'
+_CPU_NAME = re.compile(r'cpu\d+$')
+
+#: /proc/meminfo fields reported by System, all in kB
+_MEMINFO_FIELDS = {
+  b'MemTotal':     'total',
+  b'MemFree':      'free',
+  b'MemAvailable': 'available',
+  b'Buffers':      'buffers',
+  b'Cached':       'cached',
+  b'SwapCached':   'swapCached',
+  b'SwapTotal':    'swapTotal',
+  b'SwapFree':     'swapFree',
+}
+
+#: /proc/meminfo fields used by Sampler
+_SAMPLER_MEMINFO_FIELDS = {
+  b'MemTotal':     'total',
+  b'MemAvailable': 'available',
+  b'SwapTotal':    'swapTotal',
+  b'SwapFree':     'swapFree',
+}
+
+def _login():
+  # os.getlogin() fails without a controlling terminal
+  try:
+    return pwd.getpwuid(os.getuid()).pw_name
+
+  except KeyError:
+    return ''
+
+def _read(path):
+  try:
+    with open(path, 'rb') as f:
+      return f.read()
+
+  except OSError:
+    return None
+
+def _read_int(path):
+  try:
+    return int(_read(path))
+
+  except (TypeError, ValueError):
+    return None
+
+def _parse_fields(data):
+  """
+  Parses "key: value" lines, keeping the first value of repeated keys.
+  """
+  fields = {}
+
+  for line in data.splitlines():
+    key, _, value = line.partition(b':')
+    fields.setdefault(key.strip(), value.strip())
+
+  return fields
+
+#: names of common ARM cores by implementer and part, as reported by lscpu
+_ARM_IMPLEMENTERS = {
+  0x41: 'ARM',
+  0x42: 'Broadcom',
+  0x48: 'HiSilicon',
+  0x4e: 'NVIDIA',
+  0x51: 'Qualcomm',
+  0x61: 'Apple',
+  0xc0: 'Ampere',
+}
+
+_ARM_PARTS = {
+  (0x41, 0xc07): 'Cortex-A7',
+  (0x41, 0xc09): 'Cortex-A9',
+  (0x41, 0xc0f): 'Cortex-A15',
+  (0x41, 0xd03): 'Cortex-A53',
+  (0x41, 0xd04): 'Cortex-A35',
+  (0x41, 0xd05): 'Cortex-A55',
+  (0x41, 0xd07): 'Cortex-A57',
+  (0x41, 0xd08): 'Cortex-A72',
+  (0x41, 0xd09): 'Cortex-A73',
+  (0x41, 0xd0a): 'Cortex-A75',
+  (0x41, 0xd0b): 'Cortex-A76',
+  (0x41, 0xd0c): 'Neoverse-N1',
+  (0x41, 0xd0d): 'Cortex-A77',
+  (0x41, 0xd40): 'Neoverse-V1',
+  (0x41, 0xd41): 'Cortex-A78',
+  (0x41, 0xd44): 'Cortex-X1',
+  (0x41, 0xd46): 'Cortex-A510',
+  (0x41, 0xd47): 'Cortex-A710',
+  (0x41, 0xd48): 'Cortex-X2',
+  (0x41, 0xd49): 'Neoverse-N2',
+  (0x41, 0xd4f): 'Neoverse-V2',
+}
+
+def _cpu_model(fields):
+  """
+  Returns the CPU model from the first /proc/cpuinfo entry, naming ARM
+  cores, which have no model name, from their implementer and part.
+  """
+  model = fields.get(b'model name') or fields.get(b'Model') or fields.get(b'cpu model')
+
+  if model:
+    return model.decode('utf-8', 'replace')
+
+  try:
+    implementer = int(fields[b'CPU implementer'], 16)
+    part = int(fields[b'CPU part'], 16)
+
+  except (KeyError, ValueError):
+    # eg. "ARMv7 Processor rev 4 (v7l)" on older 32 bit kernels
+    model = fields.get(b'Processor')
+    return model.decode('utf-8', 'replace') if model else None
+
+  name = _ARM_PARTS.get((implementer, part))
+
+  if name is None:
+    name = '%s part 0x%03x' % (_ARM_IMPLEMENTERS.get(implementer, 'Implementer 0x%02x' % (implementer)), part)
+
+  return name
+
+def parse_meminfo(data, fields=_MEMINFO_FIELDS):
+  """
+  Parses /proc/meminfo contents in a single pass, returning the requested
+  fields, mapped to their names, in bytes.
+  """
+  info = {}
+
+  for line in data.splitlines():
+    key, _, value = line.partition(b':')
+    name = fields.get(key)
+
+    if name is not None:
+      info[name] = int(value.split()[0]) * 1024
+
+  return info
+
+def _parse_release(data):
+  """
+  Parses the KEY=value lines of os-release and lsb-release files, with
+  optionally quoted values.
+  """
+  fields = {}
+
+  for line in data.splitlines():
+    key, sep, value = line.strip().partition('=')
+
+    if not sep or key.startswith('#'):
+      continue
+
+    value = value.strip()
+
+    if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+      value = re.sub(r'\\(.)', r'\1', value[1:-1])
+
+    fields[key] = value
+
+  return fields
+
+def _read_release(*paths):
+  for path in paths:
+    data = _read(path)
+
+    if data is not None:
+      return _parse_release(data.decode('utf-8', 'replace'))
+
+  return None
+
+def os_release_provider():
+  fields = _read_release('/etc/os-release', '/usr/lib/os-release')
+
+  if not fields:
+    return None
+
+  codename = fields.get('VERSION_CODENAME')
+
+  if not codename:
+    m = re.search(r'\((.+)\)', fields.get('VERSION', ''))
+    codename = m.group(1) if m else None
+
+  return {
+    'name':     fields.get('NAME'),
+    'codename': codename,
+    # rolling releases, eg. Arch, only have a build id
+    'version':  fields.get('VERSION_ID') or fields.get('BUILD_ID'),
+  }
+
+def lsb_release_provider():
+  fields = _read_release('/etc/lsb-release')
+
+  if not fields:
+    return None
+
+  return {
+    'name':     fields.get('DISTRIB_ID'),
+    'codename': fields.get('DISTRIB_CODENAME'),
+    'version':  fields.get('DISTRIB_RELEASE'),
+  }
+
+def redhat_release_provider():
+  data = _read('/etc/redhat-release')
+
+  if data is None:
+    return None
+
+  m = re.search(r'(.+) release (\S+) \((.*)\)', data.decode('utf-8', 'replace'))
+
+  if not m:
+    return None
+
+  return {
+    'name':     m.group(1),
+    'codename': m.group(3),
+    'version':  m.group(2),
+  }
+
+#: distribution providers in order of preference, each returning a dict of
+#: "name", "codename" and "version", or None when not applicable
+DIST_PROVIDERS = [
+  os_release_provider,
+  lsb_release_provider,
+  redhat_release_provider,
+]
+
+def register_dist_provider(provider, first=True):
+  """
+  Registers a distribution provider, by default ahead of the built in
+  ones, dropping any previously detected distribution.
+  """
+  if first:
+    DIST_PROVIDERS.insert(0, provider)
+
+  else:
+    DIST_PROVIDERS.append(provider)
+
+  _detect_distribution.cache_clear()
+
+def detect_distribution():
+  """
+  Returns the "name", "codename" and "version" of the distribution, taking
+  each from the first provider knowing it. Detected once per process.
+  """
+  # a copy, the detected distribution is shared by the whole process
+  return dict(_detect_distribution())
+
+@functools.lru_cache(maxsize=1)
+def _detect_distribution():
+  dist = {
+    'name':     'Unknown',
+    'codename': 'Unknown',
+    'version':  'Unknown',
+  }
+  missing = set(dist)
+
+  for provider in DIST_PROVIDERS:
+    try:
+      info = provider()
+
+    except Exception:
+      logger.exception('Distribution provider %s failed', provider.__name__)
+      continue
+
+    if not info:
+      continue
+
+    for k in list(missing):
+      if info.get(k):
+        dist[k] = info[k]
+        missing.discard(k)
+
+    if not missing:
+      break
+
+  return dist
+
+
 
 class System():
   def __init__(self):
-    # align to current locale settings
-    locale.setlocale(locale.LC_NUMERIC, '')
-
     # store our base architecture
     arch = os.uname()[4]
 
@@ -52,7 +335,7 @@ class System():
       'codename': 'Unknown',
       'desktop':  'Unknown',
       'version':  'Unknown',
-      'live':     (os.getlogin() == 'liveuser'),
+      'live':     (_login() == 'liveuser'),
     }
     self._build_dist_info()
 
@@ -69,108 +352,99 @@ class System():
     self._build_mem_info()
 
   def _build_cpu_info(self):
-    try:
-      p = os.popen('lscpu')
-      cpuinfo = p.read()
-      p.close()
-      m = re.search('Model name:\s+(.*)', cpuinfo)
-      if m:
-        self._cpu['model'] = m.group(1)
+    # model and topology don't change, read them once
+    cpuinfo = _read('/proc/cpuinfo') or b''
+    fields = _parse_fields(cpuinfo.split(b'\n\n', 1)[0])
+
+    model = _cpu_model(fields)
+    if model:
+      self._cpu['model'] = model
 
-      m = re.search('Socket\(s\):\s+(\d+)', cpuinfo)
-      if m:
-        self._cpu['sockets'] = locale.atoi(m.group(1))
+    packages = set()
+    cores = set()
+    threads = 0
 
-      m = re.search('CPU MHz:\s+(.*)', cpuinfo)
-      if m:
-        self._cpu['clock'] = int(locale.atof(m.group(1)) * 1e6)
+    try:
+      names = os.listdir(_CPU_PATH)
 
-      m = re.search('CPU max MHz:\s+(.*)', cpuinfo)
-      if m:
-        self._cpu['clockMax'] = int(locale.atof(m.group(1)) * 1e6)
+    except OSError:
+      # no sysfs, eg. in some containers
+      names = []
 
-      m = re.search('CPU min MHz:\s+(.*)', cpuinfo)
-      if m:
-        self._cpu['clockMin'] = int(locale.atof(m.group(1)) * 1e6)
+    for name in names:
+      if not _CPU_NAME.match(name):
+        continue
 
-      m = re.search('Core\(s\) per socket:\s+(.*)', cpuinfo)
-      if m:
-        self._cpu['cores_per_sockets'] = locale.atoi(m.group(1))
+      # offline cpus have no topology
+      topology = '%s/%s/topology/' % (_CPU_PATH, name)
+      package = _read_int(topology + 'physical_package_id')
 
-      m = re.search('Thread\(s\) per core:\s+(.*)', cpuinfo)
-      if m:
-        self._cpu['threads_per_core'] = locale.atoi(m.group(1))
+      if package is None:
+        continue
 
-    except:
-      pass
+      packages.add(package)
+      cores.add((package, _read_int(topology + 'core_id')))
+      threads += 1
 
-  def _build_dist_info(self):
-    try:
-      p = open('/etc/redhat-release', 'r')
-      distinfo = p.read()
-      p.close()
-      m = re.search('(.+) release (\d+) \((.*)\)', distinfo)
-      if m:
-        self._distribution['name'] =     m.group(1)
-        self._distribution['codename'] = m.group(3)
-        self._distribution['version'] =  m.group(2)
-
-      # store desktop session
-      if 'DESKTOP_SESSION' in os.environ and not 'default' in os.environ['DESKTOP_SESSION'].lower():
-        self._distribution['desktop'] = os.environ['DESKTOP_SESSION'].upper()
-      elif 'GDMSESSION' in os.environ and not 'default' in os.environ['GDMSESSION']:
-        self._distribution['desktop'] = os.environ['GDMSESSION'].upper()
-      elif 'XDG_CURRENT_DESKTOP' in os.environ and not 'default' in os.environ['XDG_CURRENT_DESKTOP']:
-        self._distribution['desktop'] = os.environ['XDG_CURRENT_DESKTOP'].upper()
-
-      # store we are a live CD session
-      self._distribution['live'] = (os.getlogin() == 'liveuser')
-
-    except:
-      pass
+    if packages:
+      self._cpu['sockets'] = len(packages)
+      self._cpu['cores_per_sockets'] = len(cores) // len(packages)
+      self._cpu['threads_per_core'] = threads // len(cores)
 
-  def _build_mem_info(self):
-    try:
-      p = open('/proc/meminfo', 'r')
-      meminfo = p.read()
+    elif b'cpu cores' in fields:
+      # fall back to the first processor's entry
+      try:
+        cores_per_socket = int(fields[b'cpu cores'])
 
-      m = re.search('MemTotal:\s+(\d+) kB', meminfo)
-      if m:
-        self._memory['total'] = locale.atoi(m.group(1)) * 1024
+        self._cpu['sockets'] = len(set(re.findall(rb'physical id\s*:\s*(\d+)', cpuinfo))) or 1
+        self._cpu['cores_per_sockets'] = cores_per_socket
+        self._cpu['threads_per_core'] = int(fields.get(b'siblings', cores_per_socket)) // cores_per_socket
 
-      m = re.search('MemFree:\s+(\d+) kB', meminfo)
-      if m:
-        self._memory['free'] = locale.atoi(m.group(1)) * 1024
+      except (ValueError, ZeroDivisionError):
+        pass
 
-      m = re.search('MemAvailable:\s+(\d+) kB', meminfo)
-      if m:
-        self._memory['available'] = locale.atoi(m.group(1)) * 1024
+    self._cpu['clockMax'] = (_read_int(_CPU_PATH + '/cpu0/cpufreq/cpuinfo_max_freq') or 0) * 1000
+    self._cpu['clockMin'] = (_read_int(_CPU_PATH + '/cpu0/cpufreq/cpuinfo_min_freq') or 0) * 1000
 
-      m = re.search('Buffers:\s+(\d+) kB', meminfo)
-      if m:
-        self._memory['buffers'] = locale.atoi(m.group(1)) * 1024
+    self._refresh_cpu_clock(fields)
 
-      m = re.search('Cached:\s+(\d+) kB', meminfo)
-      if m:
-        self._memory['cached'] = locale.atoi(m.group(1)) * 1024
+  def _refresh_cpu_clock(self, fields=None):
+    clock = _read_int(_CPU_PATH + '/cpu0/cpufreq/scaling_cur_freq')
 
-      m = re.search('SwapCached:\s+(\d+) kB', meminfo)
-      if m:
-        self._memory['swapCached'] = locale.atoi(m.group(1)) * 1024
+    if clock is not None:
+      self._cpu['clock'] = clock * 1000
+      return
 
-      m = re.search('SwapTotal:\s+(\d+) kB', meminfo)
-      if m:
-        self._memory['swapTotal'] = locale.atoi(m.group(1)) * 1024
+    # no cpufreq support, eg. virtual machines
+    if fields is None:
+      fields = _parse_fields((_read('/proc/cpuinfo') or b'').split(b'\n\n', 1)[0])
 
-      m =re.search('SwapFree:\s+(\d+) kB', meminfo)
-      if m:
-        self._memory['swapFree'] = locale.atoi(m.group(1)) * 1024
+    try:
+      self._cpu['clock'] = int(float(fields[b'cpu MHz']) * 1e6)
 
-    except:
+    except (KeyError, ValueError):
       pass
 
+  def _build_dist_info(self):
+    self._distribution.update(detect_distribution())
+
+    # store desktop session
+    if 'DESKTOP_SESSION' in os.environ and not 'default' in os.environ['DESKTOP_SESSION'].lower():
+      self._distribution['desktop'] = os.environ['DESKTOP_SESSION'].upper()
+    elif 'GDMSESSION' in os.environ and not 'default' in os.environ['GDMSESSION']:
+      self._distribution['desktop'] = os.environ['GDMSESSION'].upper()
+    elif 'XDG_CURRENT_DESKTOP' in os.environ and not 'default' in os.environ['XDG_CURRENT_DESKTOP']:
+      self._distribution['desktop'] = os.environ['XDG_CURRENT_DESKTOP'].upper()
+
+  def _build_mem_info(self):
+    meminfo = _read('/proc/meminfo')
+
+    if meminfo is not None:
+      self._memory.update(parse_meminfo(meminfo))
+
   def refresh(self):
-    self._build_cpu_info()
+    # only the volatile fields
+    self._refresh_cpu_clock()
     self._build_mem_info()
 
   def to_dict(self):
@@ -181,3 +455,693 @@ class System():
       'current_kernel': self._current_kernel,
       'memory': self._memory
     }
+
+
+
+class RingBuffer():
+  """
+  A fixed size ring of samples backed by an array.array, overwriting the
+  oldest sample once full.
+  """
+  __slots__ = ('_data', '_size', '_count', '_head')
+
+  def __init__(self, size, typecode='d'):
+    self._data = array.array(typecode, bytes(array.array(typecode).itemsize * size))
+    self._size = size
+    self._count = 0
+    self._head = 0
+
+  def __len__(self):
+    return self._count
+
+  def __getitem__(self, i):
+    # 0 is the oldest sample, -1 the latest
+    if i < 0:
+      i += self._count
+
+    if not 0 <= i < self._count:
+      raise IndexError('ring buffer index out of range')
+
+    return self._data[(self._head - self._count + i) % self._size]
+
+  @property
+  def size(self):
+    return self._size
+
+  def append(self, value):
+    self._data[self._head] = value
+    self._head = (self._head + 1) % self._size
+
+    if self._count < self._size:
+      self._count += 1
+
+  def clear(self):
+    self._count = 0
+    self._head = 0
+
+  def last(self, default=0.0):
+    return self._data[self._head - 1] if self._count else default
+
+  def values(self, count=None, out=None):
+    """
+    Returns the latest count samples, oldest first, in out or a new array.
+    """
+    count = self._count if count is None else min(count, self._count)
+
+    if out is None:
+      out = array.array(self._data.typecode, bytes(self._data.itemsize * count))
+
+    start = self._head - count
+
+    for i in range(count):
+      out[i] = self._data[(start + i) % self._size]
+
+    return out
+
+  def window(self, count, buckets, out=None):
+    """
+    Downsamples the latest count samples to the means of buckets equal
+    slices, oldest first, in out or a new array of doubles.
+    """
+    count = min(count, self._count)
+
+    if out is None:
+      out = array.array('d', bytes(8 * buckets))
+
+    start = self._head - count
+    data = self._data
+    size = self._size
+
+    for b in range(buckets):
+      lo = b * count // buckets
+      hi = (b + 1) * count // buckets
+
+      total = 0.0
+      for i in range(lo, hi):
+        total += data[(start + i) % size]
+
+      out[b] = total / (hi - lo) if hi > lo else 0.0
+
+    return out
+
+
+
+class Sampler():
+  """
+  Samples /proc/stat, /proc/meminfo, /proc/loadavg and /proc/diskstats
+  every interval seconds, keeping a fixed history of each series in ring
+  buffers. The files are opened once and re-read with os.pread().
+
+  Series are:
+    "cpu", "cpu0" ... busy percentage of all and each core
+    "mem.used", "mem.available", "swap.used" in bytes
+    "load.1", "load.5", "load.15" load averages
+    "disk.<name>.read", "disk.<name>.write" in bytes per second
+    "time" the monotonic time of each sample
+  """
+  def __init__(self, interval=1.0, history=300, disks=None, callback=None):
+    self.interval = interval
+
+    #: called on the sampler thread after each sample
+    self.callback = callback
+
+    self._history = history
+    self._series = {}
+    self._lock = threading.Lock()
+    self._thread = None
+    self._stop = threading.Event()
+
+    self._fds = {}
+    self._bufsize = {}
+
+    for name in ('stat', 'meminfo', 'loadavg', 'diskstats'):
+      try:
+        self._fds[name] = os.open('/proc/' + name, os.O_RDONLY)
+        self._bufsize[name] = 16384
+
+      except OSError:
+        logger.warn('Unable to open /proc/%s, not sampling it', name)
+
+    # whole disks only, unless told otherwise
+    if disks is None:
+      try:
+        disks = [d for d in os.listdir('/sys/block') if not d.startswith(('loop', 'ram', 'zram'))]
+
+      except OSError:
+        disks = []
+
+    self._disks = {d.encode(): d for d in disks}
+
+    #: previous counters rates are computed from
+    self._cpu_prev = {}
+    self._disk_prev = {}
+    self._time_prev = None
+
+  def __del__(self):
+    self.close()
+
+  def _read(self, name):
+    fd = self._fds.get(name)
+
+    if fd is None:
+      return None
+
+    size = self._bufsize[name]
+    data = os.pread(fd, size, 0)
+
+    # grow the buffer until the whole file fits
+    while len(data) == size:
+      size *= 2
+      data = os.pread(fd, size, 0)
+
+    self._bufsize[name] = size
+
+    return data
+
+  def _append(self, name, value):
+    series = self._series.get(name)
+
+    if series is None:
+      series = self._series[name] = RingBuffer(self._history)
+
+    series.append(value)
+
+  def _run(self):
+    while not self._stop.wait(self.interval):
+      try:
+        self.sample()
+
+      except:
+        logger.exception('Failed to sample system')
+
+  def _sample_cpu(self, data, prime):
+    for line in data.splitlines():
+      if not line.startswith(b'cpu'):
+        break
+
+      fields = line.split()
+
+      # user nice system idle iowait irq softirq steal, guest time is
+      # already accounted to user
+      total = 0
+      for f in fields[1:9]:
+        total += int(f)
+
+      idle = int(fields[4]) + int(fields[5])
+
+      prev = self._cpu_prev.get(fields[0])
+      self._cpu_prev[fields[0]] = (total, idle)
+
+      if prime or prev is None:
+        continue
+
+      dt = total - prev[0]
+      self._append(fields[0].decode(), 100.0 * (dt - (idle - prev[1])) / dt if dt > 0 else 0.0)
+
+  def _sample_disks(self, data, elapsed, prime):
+    for line in data.splitlines():
+      fields = line.split()
+      name = self._disks.get(fields[2])
+
+      if name is None:
+        continue
+
+      # sectors are always 512 bytes in diskstats
+      read = int(fields[5]) * 512
+      written = int(fields[9]) * 512
+
+      prev = self._disk_prev.get(name)
+      self._disk_prev[name] = (read, written)
+
+      if prime or prev is None:
+        continue
+
+      self._append('disk.%s.read' % (name), (read - prev[0]) / elapsed if elapsed > 0 else 0.0)
+      self._append('disk.%s.write' % (name), (written - prev[1]) / elapsed if elapsed > 0 else 0.0)
+
+  @property
+  def names(self):
+    return list(self._series)
+
+  @property
+  def running(self):
+    return self._thread is not None
+
+  def close(self):
+    self.stop()
+
+    for fd in self._fds.values():
+      os.close(fd)
+
+    self._fds = {}
+
+  def sample(self):
+    """
+    Takes a sample now. The first sample only primes the counters rates
+    are computed from and returns False.
+    """
+    now = time.monotonic()
+    prime = self._time_prev is None
+    elapsed = 0 if prime else now - self._time_prev
+
+    self._time_prev = now
+
+    stat = self._read('stat')
+    meminfo = self._read('meminfo')
+    loadavg = self._read('loadavg')
+    diskstats = self._read('diskstats')
+
+    with self._lock:
+      if stat is not None:
+        self._sample_cpu(stat, prime)
+
+      if diskstats is not None:
+        self._sample_disks(diskstats, elapsed, prime)
+
+      if prime:
+        return False
+
+      self._append('time', now)
+
+      if meminfo is not None:
+        info = parse_meminfo(meminfo, _SAMPLER_MEMINFO_FIELDS)
+
+        self._append('mem.used', info.get('total', 0) - info.get('available', 0))
+        self._append('mem.available', info.get('available', 0))
+        self._append('swap.used', info.get('swapTotal', 0) - info.get('swapFree', 0))
+
+      if loadavg is not None:
+        fields = loadavg.split()
+
+        self._append('load.1', float(fields[0]))
+        self._append('load.5', float(fields[1]))
+        self._append('load.15', float(fields[2]))
+
+    if self.callback is not None:
+      self.callback(self)
+
+    return True
+
+  def series(self, name):
+    """
+    Returns the ring buffer of series name, or None if it isn't sampled.
+    """
+    return self._series.get(name)
+
+  def latest(self, name, default=0.0):
+    series = self._series.get(name)
+
+    return series.last(default) if series is not None else default
+
+  def start(self):
+    """
+    Samples every interval seconds on a daemon thread until stop() is
+    called.
+    """
+    if self._thread is not None:
+      return
+
+    self._stop.clear()
+
+    # prime the counters so the first interval yields rates
+    self.sample()
+
+    self._thread = threading.Thread(target=self._run, name='LensSampler')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    if self._thread is None:
+      return
+
+    self._stop.set()
+
+    if self._thread is not threading.current_thread():
+      self._thread.join()
+
+    self._thread = None
+
+  def window(self, name, seconds, buckets, out=None):
+    """
+    Downsamples the last seconds of series name to buckets means, oldest
+    first, in out or a new array of doubles.
+    """
+    series = self._series.get(name)
+
+    if out is None:
+      out = array.array('d', bytes(8 * buckets))
+
+    if series is None:
+      return out
+
+    with self._lock:
+      return series.window(int(seconds / self.interval), buckets, out)
+
+
+
+class _Process():
+  __slots__ = ('fds', 'stat', 'statm', 'ticks', 'cpu', 'starttime', 'cmdline', 'row')
+
+  def __init__(self):
+    self.fds = None
+    self.stat = None
+    self.statm = None
+    self.ticks = 0
+    self.cpu = 0.0
+    self.starttime = None
+    self.cmdline = None
+    self.row = None
+
+  def close(self):
+    if self.fds is not None:
+      os.close(self.fds[0])
+      os.close(self.fds[1])
+      self.fds = None
+
+
+
+class ProcessTable():
+  """
+  Scans /proc keeping per process state between scans, so only processes
+  whose stat or statm changed are parsed and reported, and CPU usage is
+  computed from the time consumed since the previous scan.
+
+  The stat and statm files of each process are kept open and re-read with
+  os.pread() while within max_fds open descriptors, which defaults to half
+  the soft RLIMIT_NOFILE. Remaining processes are opened on every scan.
+  """
+  def __init__(self, max_fds=None):
+    if max_fds is None:
+      soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+      max_fds = soft // 2 if soft != resource.RLIM_INFINITY else 65536
+
+    self.max_fds = max_fds
+
+    self._fds = 0
+    self._procs = {}
+    self._rows = {}
+    self._time_prev = None
+
+    self._clock_ticks = os.sysconf('SC_CLK_TCK')
+    self._page_size = os.sysconf('SC_PAGE_SIZE')
+    self._mem_total = parse_meminfo(_read('/proc/meminfo') or b'', {b'MemTotal': 'total'}).get('total', 0)
+
+  def __del__(self):
+    self.close()
+
+  def _open(self, pid):
+    p = _Process()
+
+    if self._fds + 2 <= self.max_fds:
+      path = b'/proc/%d/' % (pid)
+      fd = os.open(path + b'stat', os.O_RDONLY)
+
+      try:
+        p.fds = (fd, os.open(path + b'statm', os.O_RDONLY))
+
+      except OSError:
+        os.close(fd)
+        raise
+
+      self._fds += 2
+
+    return p
+
+  def _close(self, p):
+    if p.fds is not None:
+      p.close()
+      self._fds -= 2
+
+  def _read(self, p, pid):
+    if p.fds is not None:
+      return os.pread(p.fds[0], 4096, 0), os.pread(p.fds[1], 4096, 0)
+
+    path = b'/proc/%d/' % (pid)
+
+    with open(path + b'stat', 'rb') as f:
+      stat = f.read()
+
+    with open(path + b'statm', 'rb') as f:
+      statm = f.read()
+
+    return stat, statm
+
+  def _update(self, p, pid, stat, statm, elapsed):
+    # the command name may contain spaces and parentheses
+    i = stat.rindex(b')')
+    fields = stat[i + 2:].split()
+
+    starttime = int(fields[19])
+    ticks = int(fields[11]) + int(fields[12])
+
+    # a reused pid whose files are opened on every scan
+    if p.starttime is not None and p.starttime != starttime:
+      p.ticks = ticks
+      p.cmdline = None
+
+    comm = stat[stat.index(b'('):i + 1].decode('utf-8', 'replace')
+
+    if p.cmdline is None or (p.row is not None and p.row['comm'] != comm):
+      try:
+        with open(b'/proc/%d/cmdline' % (pid), 'rb') as f:
+          p.cmdline = f.read().replace(b'\0', b' ').strip().decode('utf-8', 'replace')
+
+      except OSError:
+        p.cmdline = ''
+
+    p.cpu = (ticks - p.ticks) * 100.0 / (self._clock_ticks * elapsed) if elapsed > 0 and p.starttime is not None else 0.0
+    p.ticks = ticks
+    p.starttime = starttime
+
+    mem = statm.split()
+    resident = int(mem[1])
+
+    p.row = {
+      'cmdline': p.cmdline,
+      'pid': pid,
+      'comm': comm,
+      'state': fields[0].decode(),
+      'ppid': int(fields[1]),
+      'priority': int(fields[15]),
+      'nice': int(fields[16]),
+      'vsize': int(fields[20]),
+      'mem_size': int(mem[0]),
+      'mem_resident': resident,
+      'mem_shared': int(mem[2]),
+      'mem_percentage': round(resident * self._page_size * 100.0 / self._mem_total, 2) if self._mem_total else 0.0,
+      'cpu_percentage': round(p.cpu, 1),
+      'cpu_time': ticks / self._clock_ticks,
+    }
+
+    p.stat = stat
+    p.statm = statm
+
+  @property
+  def open_fds(self):
+    return self._fds
+
+  @property
+  def rows(self):
+    """
+    The rows of the last scan by pid. Rows are replaced, never mutated,
+    when their process changes.
+    """
+    return self._rows
+
+  def close(self):
+    for p in self._procs.values():
+      self._close(p)
+
+    self._procs = {}
+    self._rows = {}
+    self._time_prev = None
+
+  def scan(self):
+    """
+    Scans /proc, returning a delta of the rows by pid in the format of
+    Thread.emit_state(): the rows of new or changed processes in "set",
+    the pids of exited processes in "del", the first scan being a full
+    "reset".
+    """
+    now = time.monotonic()
+    reset = self._time_prev is None
+    elapsed = 0 if reset else now - self._time_prev
+
+    self._time_prev = now
+
+    procs = self._procs
+    alive = {}
+    changed = {}
+
+    for name in os.listdir(b'/proc'):
+      if not name.isdigit():
+        continue
+
+      pid = int(name)
+      p = procs.pop(pid, None)
+
+      try:
+        if p is None:
+          p = self._open(pid)
+
+        stat, statm = self._read(p, pid)
+
+      except OSError:
+        if p is None or p.fds is None:
+          # exited since listed
+          continue
+
+        # descriptors held for a process that exited, the pid may have
+        # been reused since
+        self._close(p)
+
+        try:
+          p = self._open(pid)
+          stat, statm = self._read(p, pid)
+
+        except OSError:
+          self._close(p)
+          continue
+
+      alive[pid] = p
+
+      # idle processes are unchanged
+      if stat == p.stat and statm == p.statm and not p.cpu:
+        continue
+
+      self._update(p, pid, stat, statm, elapsed)
+      changed[pid] = p.row
+
+    for p in procs.values():
+      self._close(p)
+
+    removed = [pid for pid in procs if pid in self._rows]
+
+    self._procs = alive
+    self._rows = {pid: p.row for pid, p in alive.items()}
+
+    return {'reset': reset, 'set': changed, 'del': removed}
+
+
+
+class SystemThread(Thread):
+  """
+  Collects a System snapshot, reusing the static fields of system when
+  given, and emits it as the "snapshot" signal.
+  """
+  executor = 'thread'
+
+  def __init__(self, system=None):
+    Thread.__init__(self, daemon=True)
+
+    self.system = system
+
+  def run(self):
+    try:
+      if self.system is None:
+        self.system = System()
+
+      else:
+        self.system.refresh()
+
+      # copy the nested dicts, refresh() updates them in place
+      snapshot = {k: dict(v) if isinstance(v, dict) else v for k, v in self.system.to_dict().items()}
+
+    except Exception as e:
+      self.emit('snapshot-error', e)
+      return
+
+    self.emit('snapshot', snapshot)
+
+
+
+class SystemInfo():
+  """
+  Serves System snapshots without blocking the main loop. Snapshots are
+  collected on a ThreadManager worker, the latest one being cached.
+  """
+  def __init__(self, manager, emitter=None):
+    self._manager = manager
+    self._emitter = emitter
+
+    self._system = None
+    self._snapshot = None
+    self._thread = None
+    self._future = None
+    self._callbacks = []
+
+  def _snapshot_cb(self, thread, snapshot):
+    # keep the collected static fields for the next refresh
+    self._system = self._thread.system
+    self._snapshot = snapshot
+
+    self._complete(lambda f: f.set_result(snapshot))
+
+    if self._emitter is not None:
+      self._emitter.emit('system.snapshot', snapshot)
+
+  def _snapshot_error_cb(self, thread, e):
+    logger.warn('Failed to collect system snapshot: %s', e)
+
+    self._complete(lambda f: f.set_exception(e))
+
+  def _complete(self, resolve):
+    future = self._future
+    callbacks = self._callbacks
+
+    self._thread = None
+    self._future = None
+    self._callbacks = []
+
+    resolve(future)
+
+    if self._snapshot is not None:
+      for cb in callbacks:
+        cb(self._snapshot)
+
+  @property
+  def cached(self):
+    """
+    The latest snapshot, or None before the first one completed.
+    """
+    return self._snapshot
+
+  @property
+  def refreshing(self):
+    return self._future is not None
+
+  def snapshot(self):
+    """
+    Returns the cached snapshot, collecting one on the calling thread if
+    there is none yet.
+    """
+    if self._snapshot is None:
+      self._system = System()
+      self._snapshot = {k: dict(v) if isinstance(v, dict) else v for k, v in self._system.to_dict().items()}
+
+    return self._snapshot
+
+  def snapshot_async(self, callback=None):
+    """
+    Refreshes the snapshot on a worker, returning a concurrent.futures
+    Future of it. A refresh already in flight is shared rather than
+    started again. The optional callback receives the snapshot on the main
+    loop, which is also emitted as the "system.snapshot" signal.
+
+    Meanwhile, the previous snapshot remains available from "cached".
+    """
+    if callback is not None:
+      self._callbacks.append(callback)
+
+    if self._future is not None:
+      return self._future
+
+    self._future = future = concurrent.futures.Future()
+
+    self._thread = thread = SystemThread(self._system)
+
+    self._manager.on(thread, 'snapshot', self._snapshot_cb)
+    self._manager.on(thread, 'snapshot-error', self._snapshot_error_cb)
+    self._manager.add(thread)
+
+    return future
@@ -15,13 +15,25 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
+import asyncio
+import heapq
+import itertools
 import logging
 import multiprocessing
+import os
+import pickle
+import queue
+import threading
 import time
 import traceback
 
 from lens.view import EventEmitter
 
+try:
+  from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+  shared_memory = None
+
 __counter = 0
 def _new_name():
   global __counter
@@ -31,6 +43,23 @@ def _new_name():
 
 
 class Thread(EventEmitter):
+  #: the ThreadManager executor running this thread, one of "process" (a
+  #: separate process), "thread" (an OS thread in the app process) or
+  #: "asyncio" (a coroutine, run() may be declared async)
+  executor = 'process'
+
+  #: threads with a higher priority are started first when queued
+  priority = 0
+
+  #: signals emitted within this many seconds are sent to the app as a
+  #: single batch by process executors, 0 sends each signal immediately
+  signal_interval = 0.02
+
+  #: signal arguments of at least this many bytes (pickled, unless binary)
+  #: are passed through shared memory by process executors instead of
+  #: being pickled through the queue, 0 disables shared memory
+  shared_memory_threshold = 0
+
   def __init__(self, daemon=False):
     EventEmitter.__init__(self)
 
@@ -39,6 +68,9 @@ class Thread(EventEmitter):
     # the ID won't change when the name changes
     self._uuid = _new_name()
 
+    #: last state snapshot sent per state signal
+    self._states = {}
+
 
   @property
   def daemon(self):
@@ -52,11 +84,255 @@ class Thread(EventEmitter):
   def uuid(self):
     return self._uuid
 
+  def emit_state(self, name, state):
+    """
+    Emits the dict "state" as a delta against the snapshot last emitted for
+    signal "name". Only inserted or updated keys ("set") and deleted keys
+    ("del") are sent, the first emit being a full "reset". Snapshots must
+    not be mutated once emitted, and state signals must not be coalesced.
+
+    Use patch_state() in python, or window.lens.on_state() and
+    window.lens.patch_state() in JS, to rebuild the full state.
+    """
+    last = self._states.get(name)
+
+    if last is None:
+      delta = {'reset': True, 'set': state, 'del': []}
+
+    else:
+      delta = {
+        'reset': False,
+        'set': {k: v for k, v in state.items() if k not in last or last[k] != v},
+        'del': [k for k in last if k not in state]
+      }
+
+    self._states[name] = dict(state)
+
+    if delta['reset'] or delta['set'] or delta['del']:
+      self.emit(name, delta)
+
+  def reset_state(self, name):
+    # the next emit_state() sends the full state
+    self._states.pop(name, None)
+
   def run(self):
     pass
 
 
 
+def patch_state(state, delta):
+  """
+  Applies a delta emitted by Thread.emit_state() to state, returning the
+  full state. A reset delta replaces the state entirely.
+  """
+  if delta['reset'] or state is None:
+    state = {}
+
+  state.update(delta['set'])
+
+  for k in delta['del']:
+    state.pop(k, None)
+
+  return state
+
+
+
+class SharedPayload():
+  """
+  Handle to a signal argument placed in a shared memory segment. Binary
+  arguments are delivered as a memoryview of the segment, anything else is
+  unpickled. Segments are freed once the signal handlers return, so
+  handlers must copy binary data they want to keep.
+
+  Pickled arguments below the threshold are carried inline in "data",
+  rather than being pickled again by the queue.
+  """
+  __slots__ = ('name', 'size', 'binary', 'data')
+
+  def __init__(self, name, size, binary, data=None):
+    self.name = name
+    self.size = size
+    self.binary = binary
+    self.data = data
+
+  @staticmethod
+  def create(value, threshold):
+    binary = isinstance(value, (bytes, bytearray, memoryview))
+    data = value if binary else pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    size = len(data) if not isinstance(data, memoryview) else data.nbytes
+
+    if size < threshold:
+      # memoryviews can't be pickled by the queue
+      if binary:
+        return bytes(value) if isinstance(value, memoryview) else value
+
+      return SharedPayload(None, size, False, data)
+
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    shm.buf[:size] = data
+
+    # ownership passes to the app, which unlinks the segment
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    shm.close()
+
+    return SharedPayload(shm.name, size, binary)
+
+  def open(self):
+    if self.name is None:
+      return None, pickle.loads(self.data)
+
+    shm = shared_memory.SharedMemory(name=self.name)
+    view = shm.buf[:self.size]
+
+    if self.binary:
+      return shm, view
+
+    try:
+      return shm, pickle.loads(view)
+
+    finally:
+      view.release()
+
+  @staticmethod
+  def discard(value):
+    """
+    Frees the segment of a payload that won't be delivered.
+    """
+    if not isinstance(value, SharedPayload) or value.name is None:
+      return
+
+    try:
+      shm = shared_memory.SharedMemory(name=value.name)
+
+    except FileNotFoundError:
+      return
+
+    shm.close()
+    shm.unlink()
+
+  @staticmethod
+  def release(shm, value):
+    if isinstance(value, memoryview):
+      value.release()
+
+    try:
+      shm.close()
+
+    except BufferError:
+      # a handler kept a view of the segment, it stays mapped until released
+      pass
+
+    shm.unlink()
+
+
+
+class ThreadSignalBatcher():
+  """
+  Collects the signals of a LensThread emitted within an interval and puts
+  them on the output queue as a single list, cutting queue round trips.
+  """
+  def __init__(self, uuid, queue_out, interval, shared_memory_threshold=0):
+    self._uuid = uuid
+    self._queue_out = queue_out
+    self._interval = interval
+    self._shared_memory_threshold = shared_memory_threshold if shared_memory is not None else 0
+
+    self._batch = []
+    self._lock = threading.Lock()
+    self._timer = None
+    self._done = False
+
+  def cancel(self):
+    """
+    Drops pending and later signals and reports completion, unless the
+    thread already completed. Returns True if cancelled.
+    """
+    with self._lock:
+      if self._done:
+        return False
+
+      self._done = True
+
+      if self._timer is not None:
+        self._timer.cancel()
+        self._timer = None
+
+      # only the app could free the segments of dropped signals otherwise
+      for data in self._batch:
+        for a in data['args']:
+          SharedPayload.discard(a)
+
+      self._batch = []
+
+      self._queue_out.put({
+        'uuid': self._uuid,
+        'name': '__completed'
+      })
+
+    return True
+
+  def completed(self):
+    with self._lock:
+      if self._done:
+        return
+
+      self._done = True
+      self._flush()
+
+      self._queue_out.put({
+        'uuid': self._uuid,
+        'name': '__completed'
+      })
+
+  def flush(self):
+    with self._lock:
+      self._flush()
+
+  def _flush(self):
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+
+    if self._batch:
+      self._queue_out.put(self._batch)
+      self._batch = []
+
+  def put(self, name, *args):
+    # signals emitted after cancellation are dropped
+    if self._done:
+      return
+
+    if self._shared_memory_threshold:
+      args = [SharedPayload.create(a, self._shared_memory_threshold) for a in args]
+
+    data = {
+      'uuid': self._uuid,
+      'name': name,
+      'args': list(args)
+    }
+
+    with self._lock:
+      # cancelled while the payloads were created
+      if self._done:
+        for a in data['args']:
+          SharedPayload.discard(a)
+
+        return
+
+      if not self._interval:
+        self._queue_out.put(data)
+        return
+
+      self._batch.append(data)
+
+      if self._timer is None:
+        self._timer = threading.Timer(self._interval, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+
+
 class ThreadProcess(multiprocessing.Process):
   def __init__(self, thread, pipe_in, queue_out):
     multiprocessing.Process.__init__(self)
@@ -69,26 +345,204 @@ class ThreadProcess(multiprocessing.Process):
 
     self._pipe_in = pipe_in
     self._queue_out = queue_out
+    self._batcher = None
+
+    #: set by the app to cancel the running process
+    self._cancel = multiprocessing.Event()
 
   def _thread_signal_cb(self, name, *args):
-    self._queue_out.put({
-      'uuid': self.uuid,
-      'name': name,
-      'args': list(args)
-    })
+    self._batcher.put(name, *args)
 
   @property
   def uuid(self):
     return self._uuid
 
+  def _cancel_watch(self):
+    self._cancel.wait()
+
+    # killing the process while it writes to the queue shared by all
+    # threads would stall it, so stop signalling and wait for everything
+    # queued to be written before exiting
+    if self._batcher.cancel():
+      self._queue_out.close()
+      self._queue_out.join_thread()
+      os._exit(0)
+
+  def cancel(self):
+    # completion is reported by the process once it stopped signalling
+    self._cancel.set()
+
   def run(self):
+    self._batcher = ThreadSignalBatcher(self.uuid, self._queue_out, self._thread.signal_interval,
+                                        self._thread.shared_memory_threshold)
+
+    t = threading.Thread(target=self._cancel_watch, name='LensCancelWatch')
+    t.daemon = True
+    t.start()
 
     self._thread.run()
 
-    self._queue_out.put({
-      'uuid': self.uuid,
-      'name': '__completed'
-    })
+    self._batcher.completed()
+
+
+
+class ThreadWorker(multiprocessing.Process):
+  """
+  A long lived worker process of a ThreadPool. LensThreads are received,
+  pickled, over the task queue and run one after another, streaming their
+  signals back over the output queue.
+  """
+  def __init__(self, queue_tasks, queue_out):
+    multiprocessing.Process.__init__(self)
+
+    self.daemon = True
+
+    self._queue_tasks = queue_tasks
+    self._queue_out = queue_out
+
+  def run(self):
+    logger = logging.getLogger('Lens.ThreadWorker')
+
+    while True:
+      data = self._queue_tasks.get()
+
+      # a None task requests the worker to stop
+      if data is None:
+        break
+
+      thread = pickle.loads(data)
+
+      batcher = ThreadSignalBatcher(thread.uuid, self._queue_out, thread.signal_interval,
+                                    thread.shared_memory_threshold)
+      thread.on_any(batcher.put)
+
+      try:
+        thread.run()
+
+      except:
+        logger.warn('Caught exception in %s!\n%s', thread.uuid, traceback.format_exc())
+
+      batcher.completed()
+
+
+
+class ThreadPool():
+  """
+  A fixed number of ThreadWorker processes that are started on first use
+  and reused for every LensThread submitted.
+  """
+  def __init__(self, workers, queue_out):
+    self._size = workers
+    self._workers = []
+
+    self._queue_out = queue_out
+    self._queue_tasks = multiprocessing.Queue()
+
+  @property
+  def size(self):
+    return self._size
+
+  def close(self):
+    for w in self._workers:
+      self._queue_tasks.put(None)
+
+    self._workers = []
+
+  def submit(self, data):
+    # threads are pickled by the caller, the queue would only report
+    # pickling errors from its feeder thread
+    if not self._workers:
+      for i in range(self._size):
+        w = ThreadWorker(self._queue_tasks, self._queue_out)
+        w.start()
+        self._workers.append(w)
+
+    self._queue_tasks.put(data)
+
+
+
+class ThreadTask():
+  """
+  Stands in for a ThreadProcess when the LensThread is run on a ThreadPool.
+  """
+  def __init__(self, thread, pool):
+    self._thread = thread
+    self._uuid = thread.uuid
+    self._pool = pool
+
+  @property
+  def uuid(self):
+    return self._uuid
+
+  def start(self):
+    # raises on unpicklable threads, so the manager drops them
+    self._pool.submit(pickle.dumps(self._thread, pickle.HIGHEST_PROTOCOL))
+
+
+
+class ThreadRunner():
+  """
+  Runs a LensThread on an OS thread of the app process. Signals are handed
+  to the main loop directly, without pickling through the queue.
+  """
+  def __init__(self, thread, manager):
+    self._thread = thread
+    self._uuid = thread.uuid
+    self._manager = manager
+
+    self._thread.on_any(self._thread_signal_cb)
+
+  def _thread_signal_cb(self, name, *args):
+    self._manager._call_soon(self._manager._handle, self._uuid, name, args)
+
+  def _completed(self):
+    self._manager._call_soon(self._manager._handle, self._uuid, '__completed', None)
+
+  @property
+  def uuid(self):
+    return self._uuid
+
+  def run(self):
+    try:
+      self._thread.run()
+
+    except:
+      self._manager._logger.warn('Caught exception in %s!\n%s', self._uuid, traceback.format_exc())
+
+    self._completed()
+
+  def start(self):
+    t = threading.Thread(target=self.run, name=self._uuid)
+    t.daemon = self._thread.daemon
+    t.start()
+
+
+
+class ThreadCoroutine(ThreadRunner):
+  """
+  Runs a LensThread as a coroutine on the ThreadManager's asyncio loop.
+  """
+  async def _run(self):
+    try:
+      result = self._thread.run()
+
+      if asyncio.iscoroutine(result):
+        await result
+
+    except asyncio.CancelledError:
+      self._manager._logger.debug('Cancelled %s', self._uuid)
+
+    except:
+      self._manager._logger.warn('Caught exception in %s!\n%s', self._uuid, traceback.format_exc())
+
+    self._completed()
+
+  def cancel(self):
+    # completion is reported once the coroutine has been cancelled
+    self._future.cancel()
+
+  def start(self):
+    self._future = asyncio.run_coroutine_threadsafe(self._run(), self._manager._asyncio_loop())
 
 
 
@@ -104,81 +558,256 @@ class ThreadManager(EventEmitter):
 
     #stores all threads, running or stopped
     self.threads = {}
-    self.pendingThreadArgs = []
     self.maxConcurrentThreads = maxConcurrentThreads
 
+    #: pending threads ordered by priority, then FIFO, the uuids of the
+    #: live (not cancelled) pending entries, and running threads
+    self._pending = []
+    self._pending_seq = itertools.count()
+    self._queued = set()
+    self._running = set()
+
     self.queue_in = multiprocessing.Queue()
 
+    #: seconds the main loop may spend draining the queue per iteration
+    self.drain_budget = 0.008
 
-  def _thread_completed(self, thread):
+    #: run threads on a pool of persistent worker processes when set
+    self._pool = None
+
+    #: executors available to threads, see Thread.executor
+    self._executors = {
+      'process': self._create_process,
+      'thread':  ThreadRunner,
+      'asyncio': ThreadCoroutine,
+    }
+
+    self._loop = None
+
+  def _asyncio_loop(self):
+    # run coroutines on a dedicated loop, the main loop belongs to the toolkit
+    if self._loop is None:
+      self._loop = asyncio.new_event_loop()
+
+      t = threading.Thread(target=self._loop.run_forever, name='LensAsyncio')
+      t.daemon = True
+      t.start()
+
+    return self._loop
+
+  def _call_soon(self, callback, *args):
     """
-    Decrements the count of concurrent threads and starts any
-    pending threads if there is space
+    Schedules callback on the main loop. Backends override this to be safe
+    to call from any thread.
     """
+    callback(*args)
 
-    #: unsubscribe all signals to the thread
-    if self.threads[thread.uuid]['u']:
-      self.unsubscribe_like('__thread_%s_' % (thread.uuid))
+  def _create_process(self, thread, manager):
+    if self._pool is not None:
+      return ThreadTask(thread, self._pool)
 
-    del(self.threads[thread.uuid])
-    running = len(self.threads) - len(self.pendingThreadArgs)
+    return ThreadProcess(thread, None, self.queue_in)
 
-    self._logger.debug("%s completed. %s running, %s pending" % (thread, running, len(self.pendingThreadArgs)))
+  def _drain(self):
+    """
+    Handles all messages available on the queue, batched or not. Returns
+    False when the drain budget ran out before the queue was empty, giving
+    the main loop a chance to update the UI.
+    """
+    deadline = time.monotonic() + self.drain_budget
 
-    if running < self.maxConcurrentThreads:
+    while True:
       try:
-        uuid = self.pendingThreadArgs.pop()
+        data = self.queue_in.get_nowait()
 
-        self._logger.debug("Starting pending %s" % self.threads[uuid])
-        self.threads[uuid]['t'].start()
-        self.emit('__thread_%s_started' % (uuid), self.threads[uuid])
-        self.emit('__thread_%s_state' % (uuid), self.threads[uuid], 'started')
+      except queue.Empty:
+        return True
 
-      except IndexError:
-        pass
+      if isinstance(data, list):
+        for d in data:
+          self._handle(d['uuid'], d['name'], d.get('args'))
 
-      except:
-        self._logger.warn('Caught exception!\n%s', traceback.format_exc())
+      else:
+        self._handle(data['uuid'], data['name'], data.get('args'))
+
+      if time.monotonic() > deadline:
+        return False
+
+  def _handle(self, uuid, name, args):
+    segments = []
+
+    try:
+      if args and any(isinstance(a, SharedPayload) for a in args):
+        args = list(args)
+
+        for i, a in enumerate(args):
+          if isinstance(a, SharedPayload):
+            shm, args[i] = a.open()
+
+            if shm is not None:
+              segments.append((shm, args[i]))
+
+      # ignore late signals of cancelled threads
+      if uuid not in self.threads:
+        return
+
+      # route a signal received from a thread
+      if name == '__completed':
+        self._thread_completed(self.threads[uuid]['t'])
+
+      else:
+        self.emit('__thread_%s_%s' % (uuid, name), self.threads[uuid], *args)
+
+    finally:
+      # shared memory segments live until the handlers have returned
+      for shm, value in segments:
+        SharedPayload.release(shm, value)
+
+  def _schedule(self):
+    # start pending threads, highest priority then oldest first, while
+    # there is space
+    while self._pending and len(self._running) < self.maxConcurrentThreads:
+      priority, seq, uuid = heapq.heappop(self._pending)
+
+      # skip threads cancelled while pending
+      if uuid not in self._queued:
+        continue
+
+      self._queued.discard(uuid)
+
+      self._logger.debug("Starting pending %s", uuid)
+      self._start(uuid)
+
+  def _start(self, uuid):
+    record = self.threads[uuid]
+
+    self._running.add(uuid)
+
+    try:
+      record['t'].start()
+
+    except:
+      self._logger.warn('Caught exception!\n%s', traceback.format_exc())
+      self._running.discard(uuid)
+
+      self.emit('__thread_%s_failed' % (uuid), record['l'])
+      self.emit('__thread_%s_state' % (uuid), record['l'], 'failed')
+
+      if record['u']:
+        self.unsubscribe_namespace(uuid)
+
+      del(self.threads[uuid])
+      return False
+
+    self.emit('__thread_%s_started' % (uuid), record['l'])
+    self.emit('__thread_%s_state' % (uuid), record['l'], 'started')
+
+    return True
+
+  def _thread_completed(self, thread):
+    """
+    Removes the completed thread and starts any pending threads if there
+    is space
+    """
+
+    #: unsubscribe all signals to the thread
+    if self.threads[thread.uuid]['u']:
+      self.unsubscribe_namespace(thread.uuid)
+
+    del(self.threads[thread.uuid])
+    self._running.discard(thread.uuid)
+
+    self._logger.debug("%s completed. %s running, %s pending", thread, self.running, self.queue_depth)
+
+    self._schedule()
 
   def _register_thread_signals(self, thread, *args):
     pass
 
-  def add(self, thread, unsubscribe=True):
+  def add(self, thread, unsubscribe=True, priority=None):
     # TODO: be nicer
     if not isinstance(thread, Thread):
       raise TypeError("not a LensThread stupiD!")
 
-    running = len(self.threads) - len(self.pendingThreadArgs)
+    if priority is None:
+      priority = thread.priority
 
     _pipe = None
-    _thread = ThreadProcess(thread, _pipe, self.queue_in)
+
+    try:
+      _thread = self._executors[thread.executor](thread, self)
+
+    except KeyError:
+      raise ValueError('Unknown executor "%s" for %s' % (thread.executor, thread.uuid))
 
     uuid = _thread.uuid
 
     if uuid not in self.threads:
       self.threads[uuid] = {
         't': _thread,
+        'l': thread,
         'p': _pipe,
         'u': unsubscribe
       }
 
       self._register_thread_signals(_thread)
 
-      state = 'added'
-
-      if running < self.maxConcurrentThreads:
-        self._logger.debug("Starting %s" % _thread)
-        self.threads[uuid]['t'].start()
-        state = 'started'
-        self.emit('__thread_%s_started' % (uuid), thread)
+      if len(self._running) < self.maxConcurrentThreads:
+        self._logger.debug("Starting %s", _thread)
+        self._start(uuid)
 
       else:
-        self._logger.debug("Queing %s" % thread)
-        self.pendingThreadArgs.append(uuid)
-        state = 'queued'
+        self._logger.debug("Queing %s", thread)
+        heapq.heappush(self._pending, (-priority, next(self._pending_seq), uuid))
+        self._queued.add(uuid)
         self.emit('__thread_%s_queued' % (uuid), thread)
+        self.emit('__thread_%s_state' % (uuid), thread, 'queued')
+
+  def cancel(self, thread):
+    """
+    Cancels a queued thread, or a running thread if its executor supports
+    it. Returns True if the thread was cancelled.
+    """
+    uuid = getattr(thread, 'uuid', thread)
+    record = self.threads.get(uuid)
+
+    if record is None:
+      return False
+
+    if uuid in self._running and not hasattr(record['t'], 'cancel'):
+      return False
+
+    self._logger.debug("Cancelling %s", uuid)
+    self.emit('__thread_%s_cancelled' % (uuid), record['l'])
+    self.emit('__thread_%s_state' % (uuid), record['l'], 'cancelled')
+
+    if uuid in self._running:
+      # completion is reported through the usual path
+      record['t'].cancel()
+
+    else:
+      # the pending entry is skipped when scheduled
+      self._queued.discard(uuid)
+
+      if record['u']:
+        self.unsubscribe_namespace(uuid)
+
+      del(self.threads[uuid])
 
-      self.emit('__thread_%s_state' % (uuid), thread, state)
+    return True
+
+  @property
+  def pendingThreadArgs(self):
+    # DEPRECATE: kept for compatibility, use "queue_depth" instead
+    return [uuid for p, s, uuid in sorted(self._pending) if uuid in self._queued]
+
+  @property
+  def queue_depth(self):
+    return len(self._queued)
+
+  @property
+  def running(self):
+    return len(self._running)
 
   # DEPRECATE:
   # use add() method instead, remove in reference in 1.0.0
@@ -186,8 +815,37 @@ class ThreadManager(EventEmitter):
     self._logger.warn('The "add_thread()" method is deprecated, use "add()" instead.')
     self.add(thread, unsubscribe)
 
+  def close(self):
+    if self._pool is not None:
+      self._pool.close()
+      self._pool = None
+
+    if self._loop is not None:
+      self._loop.call_soon_threadsafe(self._loop.stop)
+      self._loop = None
+
   def on(self, thread, name, callback):
-    EventEmitter.on(self, '__thread_%s_%s' % (thread.uuid, name), callback)
+    EventEmitter.on(self, '__thread_%s_%s' % (thread.uuid, name), callback, namespace=thread.uuid)
+
+  def register_executor(self, name, factory):
+    """
+    Registers an executor for threads declaring it by name. The factory is
+    called with the thread and this manager and returns an object providing
+    a "uuid" property and a "start()" method, which must report signals and
+    completion through "_handle()" on the main loop.
+    """
+    self._executors[name] = factory
+
+  def use_pool(self, workers=None):
+    """
+    Run subsequently added threads on a pool of persistent worker processes
+    instead of forking a process per thread. The pool size defaults to the
+    maximum number of concurrent threads.
+    """
+    if self._pool is not None:
+      self._pool.close()
+
+    self._pool = ThreadPool(workers or self.maxConcurrentThreads, self.queue_in)
 
   # DEPRECATE:
   # use on() method instead, remove in 1.0.0
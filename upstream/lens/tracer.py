@@ -0,0 +1,110 @@
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('Lens.Tracer')
+
+
+class _Span():
+  def __init__(self, tracer, name, cat):
+    self._tracer = tracer
+    self._name = name
+    self._cat = cat
+
+  def __enter__(self):
+    self._start = time.perf_counter()
+    return self
+
+  def __exit__(self, *args):
+    self._tracer.complete(self._name, self._start, time.perf_counter(), self._cat)
+
+
+
+class Tracer():
+  """
+  Records monotonic timestamps of startup phases and writes them as a
+  Chrome trace (chrome://tracing, Perfetto). Disabled tracers record
+  nothing and cost a single attribute check per phase.
+  """
+  def __init__(self, enabled=False):
+    self._enabled = enabled
+    self._events = []
+    self._pid = os.getpid()
+    self._null = contextlib.nullcontext()
+
+  def _event(self, name, ph, ts, cat, **kwargs):
+    event = {
+      'name': name,
+      'cat':  cat,
+      'ph':   ph,
+      'ts':   ts * 1e6,
+      'pid':  self._pid,
+      'tid':  threading.get_ident()
+    }
+    event.update(kwargs)
+
+    self._events.append(event)
+
+  @property
+  def enabled(self):
+    return self._enabled
+
+  @property
+  def events(self):
+    return self._events
+
+  def complete(self, name, start, end, cat='startup'):
+    if self._enabled:
+      self._event(name, 'X', start, cat, dur=(end - start) * 1e6)
+
+  def instant(self, name, cat='startup'):
+    if self._enabled:
+      self._event(name, 'i', time.perf_counter(), cat, s='p')
+
+  def span(self, name, cat='startup'):
+    """
+    Returns a context manager recording the time spent within it.
+    """
+    if not self._enabled:
+      return self._null
+
+    return _Span(self, name, cat)
+
+  def write(self, path=None):
+    if not self._enabled:
+      return None
+
+    if path is None:
+      path = os.environ.get('LENS_PROFILE_OUTPUT', 'lens-startup-%d.json' % (self._pid))
+
+    with open(path, 'w') as f:
+      json.dump({'traceEvents': self._events, 'displayTimeUnit': 'ms'}, f)
+
+    logger.info('Startup trace written to: {0}'.format(path))
+
+    return path
+
+
+#: the startup tracer, enabled with LENS_PROFILE=1
+tracer = Tracer(enabled=(os.environ.get('LENS_PROFILE') == '1'))
+tracer.instant('lens imported')
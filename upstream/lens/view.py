@@ -16,28 +16,92 @@
 #
 
 import logging
+import threading
+import time
+
+from lens.blob import BlobStore
+from lens.metrics import BridgeMetrics
+from lens.resource import Routes
+from lens.serializer import Serializer, get_serializer
 
 logger = logging.getLogger('Lens.EventEmitter')
 
+#: shared empty dispatch tuple for signals without subscribers
+_NO_SUBSCRIBERS = ()
+
 class EventEmitter():
   def __init__(self):
     self.__events = {}
     self.__events_once = {}
 
+    #: precompiled, immutable subscriber tuples per signal name. These are
+    #: only rebuilt when subscriptions change so emit() stays allocation free
+    self.__dispatch = {}
+    self.__dispatch_any = _NO_SUBSCRIBERS
+
+    #: (callback, once) subscriptions by signal name per namespace, and the
+    #: namespaces per signal name, allowing a namespace's subscriptions to
+    #: be dropped without scanning every subscription
+    self.__namespaces = {}
+    self.__name_namespaces = {}
+
+  def __compile(self, name):
+    s = self.__events.get(name)
+
+    if s:
+      self.__dispatch[name] = tuple(s)
+    else:
+      self.__dispatch.pop(name, None)
+
+    if name == '__*':
+      self.__dispatch_any = self.__dispatch.get('__*', _NO_SUBSCRIBERS)
+
+  def __index(self, name, callback, once, namespace):
+    if namespace is not None:
+      self.__namespaces.setdefault(namespace, {}).setdefault(name, []).append((callback, once))
+      self.__name_namespaces.setdefault(name, set()).add(namespace)
+
+  def __prune(self, name, callback=None, once=None):
+    # drop index entries of subscriptions removed other than by namespace
+    for namespace in list(self.__name_namespaces.get(name, ())):
+      names = self.__namespaces[namespace]
+      entries = [e for e in names[name] if (callback is not None and e[0] != callback) or (once is not None and e[1] != once)]
+
+      if entries:
+        names[name] = entries
+        continue
+
+      del(names[name])
+      self.__name_namespaces[name].discard(namespace)
+
+      if not names:
+        del(self.__namespaces[namespace])
+
+    if not self.__name_namespaces.get(name, True):
+      del(self.__name_namespaces[name])
 
   def catch(self, callback=None):
     if self.on('error', callback) is not None:
       return self
 
   def emit(self, name, *args, **kwargs):
-    s = self.__events.get(name, [])        # subscribers
-    so = self.__events_once.pop(name, [])  # subscribers - once only
-    gs = self.__events.get('__*', [])      # global subscribers
+    s = self.__dispatch.get(name, _NO_SUBSCRIBERS)   # subscribers
+    gs = self.__dispatch_any                         # global subscribers
+
+    # subscribers - once only
+    so = self.__events_once.pop(name, _NO_SUBSCRIBERS) if self.__events_once else _NO_SUBSCRIBERS
+
+    if so and name in self.__name_namespaces:
+      self.__prune(name, once=True)
 
-    logger.debug('Emit %s in %s (%d, %d)' % (name, self, len(s)+len(so), len(gs)))
+    if logger.isEnabledFor(logging.DEBUG):
+      logger.debug('Emit %s in %s (%d, %d)', name, self, len(s)+len(so), len(gs))
 
     # specific (including once only) subscribers
-    for cb in s + so:
+    for cb in s:
+      cb(*args, **kwargs)
+
+    for cb in so:
       cb(*args, **kwargs)
 
     # global subscribers
@@ -45,23 +109,27 @@ class EventEmitter():
       cb(name, *args, **kwargs)
 
   def has_subscribers(self, name):
-    return len(self.subscribers()) > 0
+    return len(self.subscribers(name)) > 0
 
-  def on(self, name, callback):
-    logger.debug('Subscribing %s on %s' % (name, callback))
+  def on(self, name, callback, namespace=None):
+    logger.debug('Subscribing %s on %s', name, callback)
     self.__events.setdefault(name, []).append(callback)
+    self.__index(name, callback, False, namespace)
+    self.__compile(name)
 
     return callback
 
   def on_any(self, callback):
-    logger.debug('Subscribing %s on any signal' % (callback))
+    logger.debug('Subscribing %s on any signal', callback)
     self.__events.setdefault('__*', []).append(callback)
+    self.__compile('__*')
 
     return callback
 
-  def once(self, name, callback):
-    logger.debug('Subscribing %s on %s for one time only' % (name, callback))
+  def once(self, name, callback, namespace=None):
+    logger.debug('Subscribing %s on %s for one time only', name, callback)
     self.__events_once.setdefault(name, []).append(callback)
+    self.__index(name, callback, True, namespace)
 
     return callback
 
@@ -80,13 +148,50 @@ class EventEmitter():
     else:
       self.__events.pop(name, None)
 
+    if name in self.__name_namespaces:
+      self.__prune(name, callback, once=False)
+
+    self.__compile(name)
+
   def unsubscribe_like(self, like):
     # filter out any subscriptions based on "like"-ness
-    self.__events = {k:self.__events[k] for k in self.__events if like not in k}
+    for k in [k for k in self.__events if like in k]:
+      self.__events.pop(k, None)
+
+      if k in self.__name_namespaces:
+        self.__prune(k, once=False)
+
+      self.__compile(k)
+
+  def unsubscribe_namespace(self, namespace):
+    # remove the subscriptions registered under the namespace only, leaving
+    # other subscribers of the same signals in place
+    for k, entries in self.__namespaces.pop(namespace, {}).items():
+      for callback, once in entries:
+        events = self.__events_once if once else self.__events
+        s = events.get(k)
+
+        if s is not None and callback in s:
+          s.remove(callback)
+
+          if not s:
+            del(events[k])
+
+      ns = self.__name_namespaces.get(k)
+      if ns is not None:
+        ns.discard(namespace)
+
+        if not ns:
+          del(self.__name_namespaces[k])
+
+      self.__compile(k)
 
 
 
 class View(EventEmitter):
+  #: whether the backend serves the blobs at lens://blob/<id>
+  serves_blobs = False
+
   def __init__(self, name="MyLensApp", width=640, height=480, *args, **kwargs):
     EventEmitter.__init__(self)
 
@@ -95,13 +200,109 @@ class View(EventEmitter):
     self._app_height = height
 
     self._javascript = 'window.lens.__emit(%s)'
+    self._javascript_batch = 'window.lens.__emit_batch(%s)'
+    self._javascript_reply = 'window.lens.__rpc_reply(%s)'
+
+    #: python to JS emits collected until the next main loop iteration
+    self._js_batching = False
+    self._js_batch = []
+    self._js_coalesce = {}
+    self._js_coalesced = {}
+    self._js_flush_pending = False
+
+    #: counters of messages crossing the bridge, disabled by default
+    self._metrics = BridgeMetrics()
+
+    self._main_thread = threading.get_ident()
+
+    #: encodes and decodes bridge messages
+    self._serializer = get_serializer()
+
+    #: binary buffers served to JS at lens://blob/<id>
+    self._blobs = BlobStore()
+
+    #: dynamic app:// routes
+    self._routes = Routes()
 
   def _build_app(self):
     raise NotImplementedError('Method "build_app" needs to be subclassed.')
 
+  def _flush_js(self):
+    batch = [m for m in self._js_batch if m is not None]
+
+    self._js_batch = []
+    self._js_coalesced = {}
+    self._js_flush_pending = False
+
+    if batch:
+      if self._metrics.enabled:
+        _start = time.perf_counter()
+        data = self._serializer.dumps(batch)
+        self._metrics.record_out('__batch', len(data), time.perf_counter() - _start)
+
+      else:
+        data = self._serializer.dumps(batch)
+
+      self._run_js(self._javascript_batch % data)
+
+    # don't repeat when called as an idle callback
+    return False
+
   def _on_js(self, thread, name, args):
+    if self._metrics.enabled:
+      _start = time.perf_counter()
+      self.emit(name, *args)
+      self._metrics.record_in(name, 0, None, time.perf_counter() - _start)
+      return
+
     self.emit(name, *args)
 
+  def _on_js_message(self, data):
+    # decode a message crossing the JS/python bridge, regardless of the
+    # transport (script message, web channel or title) it arrived on
+    _start = time.perf_counter() if self._metrics.enabled else None
+
+    try:
+      _in = self._serializer.loads(data)
+
+      _name = _in.setdefault('name', '')
+      _args = _in.setdefault('args', [])
+
+    except:
+      return
+
+    if _start is None:
+      self.emit(_name, *_args)
+      return
+
+    _decoded = time.perf_counter()
+    self.emit(_name, *_args)
+    self._metrics.record_in(_name, len(data), _decoded - _start, time.perf_counter() - _decoded)
+
+  @property
+  def blobs(self):
+    return self._blobs
+
+  @property
+  def routes(self):
+    return self._routes
+
+  @property
+  def serializer(self):
+    return self._serializer
+
+  @serializer.setter
+  def serializer(self, serializer):
+    # accept a serializer instance or name
+    if not isinstance(serializer, Serializer):
+      serializer = get_serializer(serializer)
+
+    self._serializer = serializer
+
+  @property
+  def metrics(self):
+    return self._metrics
+
   @property
   def javascript(self):
     return self._javascript
@@ -110,11 +311,79 @@ class View(EventEmitter):
   def javascript(self, data):
     self._javascript = data
 
+  def _run_js(self, script):
+    raise NotImplementedError('Method "_run_js" needs to be subclassed.')
+
+  def _schedule_js_flush(self):
+    raise NotImplementedError('Method "_schedule_js_flush" needs to be subclassed.')
+
   def close(self, *args, **kwargs):
     self.emit('__close_app')
 
+  def coalesce_js(self, name, key=None):
+    """
+    Only deliver the latest value of signal "name" queued within a batch. An
+    optional key function receives the signal arguments and returns the key
+    values are superseded by, otherwise the signal name alone is used.
+    """
+    self._js_coalesce[name] = key
+
   def emit_js(self, name, *args):
-    raise NotImplementedError('Method "emit_js" needs to be subclassed.')
+    # signals emitted off the main loop, eg. by offloaded handlers, are
+    # handed over to it first
+    if threading.get_ident() != self._main_thread:
+      self._manager._call_soon(self.emit_js, name, *args)
+      return
+
+    if not self._js_batching:
+      if self._metrics.enabled:
+        _start = time.perf_counter()
+        data = self._serializer.dumps([name] + list(args))
+        self._metrics.record_out(name, len(data), time.perf_counter() - _start)
+
+      else:
+        data = self._serializer.dumps([name] + list(args))
+
+      self._run_js(self._javascript % data)
+      return
+
+    # batched emits are encoded, and measured, as one "__batch"
+    if self._metrics.enabled:
+      self._metrics.record_out(name)
+
+    if name in self._js_coalesce:
+      key = self._js_coalesce[name]
+      key = (name, key(*args) if key is not None else None)
+
+      # drop the superseded value, keeping the latest in emit order
+      i = self._js_coalesced.get(key)
+      if i is not None:
+        self._js_batch[i] = None
+
+      self._js_coalesced[key] = len(self._js_batch)
+
+    self._js_batch.append([name] + list(args))
+
+    if not self._js_flush_pending:
+      self._js_flush_pending = True
+      self._schedule_js_flush()
+
+  def reply_js(self, id, error, result):
+    # replies go to the pending call only, bypassing batching so latency
+    # isn't bound to the flush interval
+    if threading.get_ident() != self._main_thread:
+      self._manager._call_soon(self.reply_js, id, error, result)
+      return
+
+    if self._metrics.enabled:
+      _start = time.perf_counter()
+      data = self._serializer.dumps([id, error, result])
+      self._metrics.record_out('__rpc_reply', len(data), time.perf_counter() - _start)
+
+    else:
+      data = self._serializer.dumps([id, error, result])
+
+    self._run_js(self._javascript_reply % data)
 
   def load_uri(self, uri):
     raise NotImplementedError('Method "load_uri" needs to be subclassed.')
@@ -122,6 +391,13 @@ class View(EventEmitter):
   def set_inspector(self, state):
     raise NotImplementedError('Method "set_inspector" needs to be subclassed.')
 
+  def set_js_batching(self, state):
+    self._js_batching = bool(state)
+
+    # deliver anything still queued when batching is turned off
+    if not self._js_batching and self._js_batch:
+      self._flush_js()
+
   def set_size(self, name, message):
     raise NotImplementedError('Method "set_size" needs to be subclassed.')
 
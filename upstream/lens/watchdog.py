@@ -0,0 +1,132 @@
+#
+# Copyright 2012-2015 "Korora Project" <dev@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the temms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import concurrent.futures
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+
+logger = logging.getLogger('Lens.Watchdog')
+
+
+class Watchdog():
+  """
+  Measures the runtime of signal handlers running on the main loop. Handlers
+  exceeding the budget (in seconds) are logged along with a stack sample
+  taken while they were still running.
+
+  With offload enabled, handlers that exceeded the budget are run on a
+  worker thread from then on. Offloaded handlers must be thread safe, they
+  may still emit signals to the UI.
+  """
+  def __init__(self, budget=0.05, offload=False, workers=2):
+    self.budget = budget
+    self.offload = offload
+
+    self._workers = workers
+    self._executor = None
+
+    #: the handler currently running on the main loop
+    self._lock = threading.Lock()
+    self._current = None
+    self._sample = None
+
+    #: handlers that exceeded the budget
+    self._slow = set()
+
+    self._monitor = threading.Thread(target=self._monitor_cb, name='LensWatchdog')
+    self._monitor.daemon = True
+    self._monitor.start()
+
+  def _monitor_cb(self):
+    # sample the stack of handlers still running past their budget
+    while True:
+      time.sleep(self.budget / 2)
+
+      with self._lock:
+        if self._current is None or self._sample is not None:
+          continue
+
+        ident, start = self._current
+
+        if time.perf_counter() - start > self.budget:
+          frame = sys._current_frames().get(ident)
+
+          if frame is not None:
+            self._sample = ''.join(traceback.format_stack(frame))
+
+  def _offload(self, name, callback, args, kwargs):
+    if self._executor is None:
+      self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._workers)
+
+    def _run():
+      try:
+        callback(*args, **kwargs)
+
+      except:
+        logger.warn('Caught exception in offloaded handler %s of %s!\n%s', callback, name, traceback.format_exc())
+
+    self._executor.submit(_run)
+
+  @property
+  def slow(self):
+    return list(self._slow)
+
+  def wrap(self, name, callback):
+    """
+    Returns callback wrapped to be measured when run as a handler of signal
+    "name".
+    """
+    @functools.wraps(callback)
+    def _watched(*args, **kwargs):
+      if self.offload and callback in self._slow:
+        return self._offload(name, callback, args, kwargs)
+
+      # handlers emitting signals nest, only the outermost is sampled
+      with self._lock:
+        outer = self._current is None
+
+        if outer:
+          self._current = (threading.get_ident(), time.perf_counter())
+          self._sample = None
+
+      start = time.perf_counter()
+
+      try:
+        return callback(*args, **kwargs)
+
+      finally:
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+          sample = self._sample
+
+          if outer:
+            self._current = None
+            self._sample = None
+
+        if elapsed > self.budget:
+          self._slow.add(callback)
+
+          logger.warn('Handler %s of %s took %.1fms (budget %.1fms)%s', callback, name,
+                      elapsed * 1e3, self.budget * 1e3,
+                      ', sampled at:\n' + sample if sample else '')
+
+    return _watched
@@ -41,7 +41,10 @@ class LongTask(Thread):
 
 
 
-app = App(name="Lens. Threads")
+app = App(name="Lens. Threads", batch_emits=True)
+
+# only deliver the latest progress of each task per UI update
+app.coalesce('long-task-progress', key=lambda uuid, progress: uuid)
 
 # load the app entry page
 app.namespaces.append('./sample-data/app-threads')
@@ -16,52 +16,29 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
-import os
 import pprint
 import time
 
 from lens.app import App
+from lens.system import ProcessTable
 from lens.thread import Thread
 
 class ProcTask(Thread):
+  # pass the process table through shared memory rather than the queue
+  shared_memory_threshold = 64 * 1024
+
   def __init__(self):
     Thread.__init__(self)
 
   def run(self):
-    while 1:
-      pids = [pid for pid in os.listdir('/proc') if pid.isdigit()]
-
-      loadavg = open('/proc/loadavg', 'r').read().strip().split(' ')
-      meminfo = [x.split()[1] for x in open('/proc/meminfo', 'r').read().strip().split('\n')]
-
-      proc = []
+    table = ProcessTable()
 
-      for pid in pids:
-        try:
-          stats = open(os.path.join('/proc', pid, 'stat'), 'r').read().strip().split(' ')
-          statm = open(os.path.join('/proc', pid, 'statm'), 'r').read().strip().split(' ')
-          cmdline = open(os.path.join('/proc', pid, 'cmdline'), 'r').read()
-
-          proc.append({
-            'cmdline': cmdline,
-            'pid': int(stats[0]),
-            'comm': stats[1],
-            'state': stats[2],
-            'ppid': int(stats[3]),
-            'priority': int(stats[17]),
-            'nice': int(stats[18]),
-            'vsize': int(stats[22]),
-            'mem_size': int(statm[0]),
-            'mem_resident': int(statm[1]),
-            'mem_shared': int(statm[2]),
-            'mem_percentage': round(int(statm[1]) * 100.0 / int(meminfo[0]), 2)
-          })
-
-        except:
-          # proc has already terminated
-          continue
+    while 1:
+      # only the processes that changed since the last scan are sent
+      delta = table.scan()
 
-      self.emit('proc-update', proc)
+      if delta['reset'] or delta['set'] or delta['del']:
+        self.emit('proc-update', delta)
 
       time.sleep(5)
 
@@ -82,7 +59,7 @@ def _start_proc_watch_cb(*args):
   app.threads.add(t)
   app.threads.on(t, 'proc-update', _proctask_update_cb)
 
-def _proctask_update_cb(thread, proc):
-  app.emit('update-proc', proc)
+def _proctask_update_cb(thread, delta):
+  app.emit('update-proc', delta)
 
 app.start()
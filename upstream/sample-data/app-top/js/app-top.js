@@ -15,9 +15,9 @@ app.controller('AppCtrl', function($scope) {
     { key: 'mem_resident',   label: 'RES' },
     { key: 'mem_shared', label: 'SHR' },
     { key: 'state', label: 'S' },
-    { key: 'status', label: 'CPU' },
+    { key: 'cpu_percentage', label: 'CPU' },
     { key: 'mem_percentage', label: 'MEM' },
-    { key: 'status', label: 'TIME' },
+    { key: 'cpu_time', label: 'TIME' },
     { key: 'cmdline',  label: 'Command' },
   ];
 
@@ -42,8 +42,14 @@ app.controller('AppCtrl', function($scope) {
   };
 
   /* SIGNALS */
-  $scope.$on('update-proc', function(e, p) {
-    $scope.proc = p;
+  var procs = null;
+
+  $scope.$on('update-proc', function(e, delta) {
+    procs = window.lens.patch_state(procs, delta);
+
+    $scope.proc = Object.keys(procs).map(function(pid) {
+      return procs[pid];
+    });
   });
 
   $scope.closeApp = function() {
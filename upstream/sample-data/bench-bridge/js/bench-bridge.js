@@ -0,0 +1,37 @@
+(function() {
+  var count = 2000;
+  var payload = new Array(64).join('x');
+
+  /* always run the title fallback first, then the detected transport */
+  var transports = ['title', null];
+
+  function run() {
+    var transport = transports.shift();
+
+    if (transport === undefined) {
+      window.lens.__transport = null;
+      window.lens.emit('bench-finished');
+      return;
+    }
+
+    window.lens.__transport = transport;
+
+    var name = transport || window.lens.__detect_transport();
+
+    window.lens.emit('bench-start', name, count);
+
+    for (var i = 0; i < count; i++) {
+      window.lens.emit('bench-message', i, payload);
+    }
+
+    /* give the bridge time to deliver before reporting */
+    setTimeout(function() {
+      window.lens.emit('bench-done', name);
+      setTimeout(run, 250);
+    }, 1000);
+  }
+
+  window.addEventListener('load', function() {
+    setTimeout(run, 250);
+  });
+})();
@@ -0,0 +1,63 @@
+(function() {
+  var count = 500;
+
+  /* round trip made count times in sequence, per benchmark */
+  var benchmarks = [
+    ['signals', function() {
+      return new Promise(function(resolve) {
+        window.lens.once('bench-pong', resolve);
+        window.lens.emit('bench-ping', 1);
+      });
+    }],
+    ['sync', function() {
+      return window.lens.call('bench-sync', 1);
+    }],
+    ['async', function() {
+      return window.lens.call('bench-async', 1);
+    }],
+    ['thread', function() {
+      return window.lens.call('bench-thread', 1);
+    }]
+  ];
+
+  function percentile(samples, p) {
+    return samples[Math.min(samples.length - 1, Math.floor(samples.length * p))];
+  }
+
+  function run() {
+    var benchmark = benchmarks.shift();
+
+    if (benchmark === undefined) {
+      window.lens.emit('bench-finished');
+      return;
+    }
+
+    var samples = [];
+    var start = performance.now();
+
+    function next() {
+      if (samples.length === count) {
+        var elapsed = performance.now() - start;
+
+        samples.sort(function(a, b) { return a - b; });
+        window.lens.emit('bench-report', benchmark[0], count, elapsed, percentile(samples, 0.5), percentile(samples, 0.99));
+
+        setTimeout(run, 250);
+        return;
+      }
+
+      var t = performance.now();
+
+      benchmark[1]().then(function() {
+        samples.push(performance.now() - t);
+        next();
+      });
+    }
+
+    next();
+  }
+
+  window.addEventListener('load', function() {
+    setTimeout(run, 250);
+  });
+})();